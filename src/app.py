@@ -1,8 +1,11 @@
 import csv
+import hashlib
 import io
 import os
-import uuid
+import shutil
 import json
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 import pandas as pd
@@ -17,8 +20,8 @@ from flask import (
 )
 # Local
 from combocounter import ComboCounter
-from field import Field
-from processing import ProcessDraftKingsFile
+from field import Field, FieldCache
+from processing import CorpusStore, ProcessDraftKingsFile, tournament_combos
 
 from __info import PLAYER_COLUMNS
 
@@ -46,6 +49,23 @@ if not os.path.exists(CACHE_DIR):
 # Set cache expiry time
 CACHE_EXPIRY = timedelta(hours=1)  # Cache files for 1 hour
 
+# Live Field objects of this worker, bounded by an estimated size in bytes (512MB by default)
+FIELD_CACHE = FieldCache(max_bytes=int(os.environ.get('FIELD_CACHE_BYTES', 512 * 2**20)))
+
+# Standings files bigger than this are streamed into the Field in chunks of INGEST_CHUNKSIZE rows
+STREAMING_INGEST_BYTES = 16 * 2**20
+INGEST_CHUNKSIZE = 50_000
+
+# Every newly loaded Field gets ownership, max entries, MME ownership and duplicates computed here in the background
+PRECOMPUTE_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix='precompute')
+
+# Compiled max-entries directories (see CorpusStore) are kept with the rest of the writable state, data/ may be read-only
+CORPUS_STORE_DIR = os.path.join(CACHE_DIR, 'corpus')
+
+# Fields served from memory push their files' expiry back at most this often
+CACHE_TOUCH_INTERVAL = timedelta(minutes=5)
+LAST_TOUCHED = {}
+
 # app = Flask(__name__)
 app = Flask(__name__, static_folder='static')
 app.config['JSON_SORT_KEYS'] = False
@@ -69,128 +89,236 @@ def cleanup_cache():
                     # Remove the metadata file
                     os.remove(metadata_path)
 
+                    # Drop the live Field objects built from it
+                    file_id = filename[:-len('.json')]
+                    for key in FIELD_CACHE.keys():
+                        if key[0] == file_id:
+                            FIELD_CACHE.pop(key)
+                    LAST_TOUCHED.pop(file_id, None)
+
                     # Remove the corresponding data file if it exists
                     data_path = os.path.join(CACHE_DIR, metadata.get('data_file', ''))
                     if os.path.exists(data_path):
                         os.remove(data_path)
+
+                    # Remove the parsed field snapshots (one per sport/mode it was opened with)
+                    for snapshot_dirname in metadata.get('snapshots', {}).values():
+                        snapshot_path = os.path.join(CACHE_DIR, snapshot_dirname)
+                        if os.path.isdir(snapshot_path):
+                            shutil.rmtree(snapshot_path)
             except Exception as e:
                 print(f"Error cleaning up cache: {e}")
 
+def field_cache_key(file_id: str, kwargs: dict) -> tuple:
+    return (file_id, tuple(sorted(kwargs.items())))
+
+def write_atomic(path: str, content: bytes) -> None:
+    """
+    Writes a cache file through a uniquely named temporary file renamed into place
+    Concurrent requests never see (or leave behind) a half-written file
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f"{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def touch_cache_entry(file_id: str) -> None:
+    """
+    Pushes back the expiry of a cached file's metadata
+    """
+    metadata_path = os.path.join(CACHE_DIR, f"{file_id}.json")
+    if not os.path.exists(metadata_path):
+        return
+
+    with open(metadata_path, 'r') as f:
+        metadata = json.load(f)
+
+    metadata['expiry'] = (datetime.now() + CACHE_EXPIRY).isoformat()
+    write_atomic(metadata_path, json.dumps(metadata).encode())
+
+    LAST_TOUCHED[file_id] = datetime.now()
+
+def snapshot_dirname(file_id: str, kwargs: dict) -> str:
+    """
+    The parsed field depends on the kwargs (sport/mode) as well as on the file's content
+    """
+    kwargs_hash = hashlib.sha256(json.dumps(kwargs, sort_keys=True).encode()).hexdigest()[:16]
+    return f"{file_id}.{kwargs_hash}.field"
+
+def tournament_directory(tournament: str | None) -> str | None:
+    """
+    Directory of a tournament under DATA_DIR (DATA_DIR itself when there is none)
+    None for anything that resolves outside of DATA_DIR, e.g. "../.."
+    """
+    data_dir = os.path.realpath(DATA_DIR)
+
+    if tournament and tournament != 'none':
+        directory = os.path.realpath(os.path.join(data_dir, tournament))
+    else:
+        directory = data_dir
+
+    if os.path.commonpath([directory, data_dir]) != data_dir:
+        return None
+
+    return directory
+
+def load_corpus_store(directory: str) -> CorpusStore:
+    """
+    Compiled store of a directory checked by tournament_directory(), kept under CORPUS_STORE_DIR
+    """
+    relative = os.path.relpath(directory, os.path.realpath(DATA_DIR))
+    return CorpusStore.load(directory, os.path.normpath(os.path.join(CORPUS_STORE_DIR, relative)))
+
+def remember_file(file_id: str) -> None:
+    """
+    Store only the ID in session, once its Field loaded
+    A file that fails to parse must not replace the session's last working file
+    """
+    session['file_id'] = file_id
+    print(f"File ID {file_id} stored in session")
+
 def get_or_create_field(file=None, file_buffer=None, **kwargs):
     """
     Get an existing Field object from session or create a new one,
     using filesystem-based caching
+        - Uploads are content-addressed: file_id is the sha256 of the file, so identical contest files
+          share one stored copy, one snapshot per sport/mode and one live Field; sessions only hold the file_id
+        - Ready Field objects are kept in FIELD_CACHE, back-to-back requests of a session never touch disk or pandas
     """
     print("Entering get_or_create_field...")
-    cleanup_cache()  # Clean up expired files
 
-    # If we have a file or file_buffer, create a new Field object
+    file_content = None
+
+    # If we have a file or file_buffer, its content is the cache key
     if file is not None or file_buffer is not None:
         if file is not None:
             print(f"File provided: {file.filename if hasattr(file, 'filename') else 'No filename'}")
             file_content = file.read()
-            buffer = io.BytesIO(file_content)
         else:
             print("File buffer provided")
-            buffer = file_buffer
             # Get the content for caching
-            buffer.seek(0)
-            file_content = buffer.read()
-            buffer.seek(0)
+            file_buffer.seek(0)
+            file_content = file_buffer.read()
+            file_buffer.seek(0)
 
         print(f"File content size: {len(file_content)} bytes")
 
-        try:
-            # Create Field instance
-            field = Field(buffer, **kwargs)
-            print("Field object created")
+        file_id = hashlib.sha256(file_content).hexdigest()
 
-            field.clean_data()
-            print("clean_data completed")
-
-            # Generate unique ID for this file
-            file_id = str(uuid.uuid4())
-
-            # Save the actual file content to disk
-            data_filename = f"{file_id}.data"
-            data_path = os.path.join(CACHE_DIR, data_filename)
-            with open(data_path, 'wb') as f:
-                f.write(file_content)
+    # No file provided, try to get from cache
+    elif 'file_id' in session:
+        file_id = session['file_id']
+        print(f"No file provided, retrieving from cache with ID: {file_id}")
 
-            # Save metadata
-            metadata = {
-                'data_file': data_filename,
-                'expiry': (datetime.now() + CACHE_EXPIRY).isoformat(),
-                'kwargs': kwargs
-            }
+    else:
+        print("No file provided and no valid cache data available")
+        return None
 
-            metadata_path = os.path.join(CACHE_DIR, f"{file_id}.json")
-            with open(metadata_path, 'w') as f:
-                json.dump(metadata, f)
+    field = FIELD_CACHE.get(field_cache_key(file_id, kwargs))
+    if field is not None:
+        print(f"Field for ID {file_id} served from memory")
+        remember_file(file_id)
 
-            # Store only the ID in session
-            session['file_id'] = file_id
-            print(f"File ID {file_id} stored in session")
+        if datetime.now() - LAST_TOUCHED.get(file_id, datetime.min) > CACHE_TOUCH_INTERVAL:
+            touch_cache_entry(file_id)
 
-            return field
-        except Exception as e:
-            print(f"Error creating Field: {e}")
-            import traceback
-            print(traceback.format_exc())
-            raise
+        return field
 
-    # No file provided, try to get from filesystem cache
-    elif 'file_id' in session:
-        file_id = session['file_id']
-        print(f"No file provided, retrieving from cache with ID: {file_id}")
+    cleanup_cache()  # Clean up expired files
 
-        try:
-            # Check if metadata file exists
-            metadata_path = os.path.join(CACHE_DIR, f"{file_id}.json")
-            if not os.path.exists(metadata_path):
-                print(f"No metadata file found for ID: {file_id}")
-                return None
+    try:
+        metadata_path = os.path.join(CACHE_DIR, f"{file_id}.json")
 
+        if os.path.exists(metadata_path):
             # Load metadata
             with open(metadata_path, 'r') as f:
                 metadata = json.load(f)
+        elif file_content is not None:
+            metadata = {'data_file': f"{file_id}.data", 'kwargs': kwargs, 'snapshots': {}}
+        else:
+            print(f"No metadata file found for ID: {file_id}")
+            return None
 
-            # Check if data file exists
-            data_filename = metadata.get('data_file')
-            data_path = os.path.join(CACHE_DIR, data_filename)
-            if not os.path.exists(data_path):
-                print(f"No data file found: {data_filename}")
-                return None
-
-            # Load file content
-            with open(data_path, 'rb') as f:
-                file_content = f.read()
+        data_path = os.path.join(CACHE_DIR, metadata['data_file'])
 
-            # Update expiry time
-            metadata['expiry'] = (datetime.now() + CACHE_EXPIRY).isoformat()
-            with open(metadata_path, 'w') as f:
-                json.dump(metadata, f)
+        # Merge cached kwargs with provided kwargs
+        merged_kwargs = {**metadata.get('kwargs', {}), **kwargs}
 
-            # Merge cached kwargs with provided kwargs
-            cached_kwargs = metadata.get('kwargs', {})
-            merged_kwargs = {**cached_kwargs, **kwargs}
+        # Fast path: snapshot of the field cleaned with the same kwargs
+        snapshots = metadata.setdefault('snapshots', {})
+        snapshot_key = json.dumps(kwargs, sort_keys=True)
+        snapshot_path = os.path.join(CACHE_DIR, snapshots.get(snapshot_key, ''))
 
-            # Create Field instance
-            buffer = io.BytesIO(file_content)
-            field = Field(buffer, **merged_kwargs)
-            print("Field object created from cached data")
+        if snapshot_key in snapshots and os.path.exists(os.path.join(snapshot_path, 'snapshot.json')):
+            field = Field.from_snapshot(snapshot_path)
+            print("Field object loaded from snapshot")
+        else:
+            if file_content is None:
+                # Check if data file exists
+                if not os.path.exists(data_path):
+                    print(f"No data file found: {metadata['data_file']}")
+                    return None
+
+                # Load file content
+                with open(data_path, 'rb') as f:
+                    file_content = f.read()
+
+            # Create Field instance, big files are streamed so peak memory stays bounded
+            if len(file_content) > STREAMING_INGEST_BYTES:
+                field = Field(io.BytesIO(file_content), chunksize=INGEST_CHUNKSIZE, **merged_kwargs)
+            else:
+                field = Field(io.BytesIO(file_content), **merged_kwargs)
+            print("Field object created")
 
             field.clean_data()
             print("clean_data completed")
 
-            return field
-        except Exception as e:
-            print(f"Error retrieving Field from cache: {e}")
-            import traceback
-            print(traceback.format_exc())
-            # Continue to return None
+            # Save the cleaned field, later requests memory-map it instead of re-parsing the CSV
+            snapshots[snapshot_key] = snapshot_dirname(file_id, kwargs)
+            field.save_snapshot(os.path.join(CACHE_DIR, snapshots[snapshot_key]))
+
+        # Save the actual file content to disk, once per distinct file
+        # Only once it parsed, cleanup_cache() goes by the metadata files and would never remove it otherwise
+        if file_content is not None and not os.path.exists(data_path):
+            write_atomic(data_path, file_content)
+
+        # Save metadata with an updated expiry time
+        metadata['expiry'] = (datetime.now() + CACHE_EXPIRY).isoformat()
+        write_atomic(metadata_path, json.dumps(metadata).encode())
+        LAST_TOUCHED[file_id] = datetime.now()
+
+        # Endpoints only wait on these if they have not finished yet
+        futures = field.precompute(PRECOMPUTE_POOL)
+
+        cache_key = field_cache_key(file_id, kwargs)
+        FIELD_CACHE.put(cache_key, field)
+
+        # The precomputed results count against the cache budget as well, the field is re-measured once they are in
+        pending = set(futures)
+
+        def resize_when_done(future):
+            pending.discard(future)
+            if not pending:
+                FIELD_CACHE.resize(cache_key)
+
+        for future in futures:
+            future.add_done_callback(resize_when_done)
+
+        remember_file(file_id)
+        return field
+    except Exception as e:
+        print(f"Error getting Field for ID {file_id}: {e}")
+        import traceback
+        print(traceback.format_exc())
+
+        # A bad upload is an error, a broken cache entry just means there is no cached field
+        if file is not None or file_buffer is not None:
+            raise
 
-    print("No file provided and no valid cache data available")
     return None
 
 def adjust_key(key, **kwargs) -> str:
@@ -200,13 +328,31 @@ def adjust_key(key, **kwargs) -> str:
     """
     return key if isinstance(key, str) else kwargs.get('char', ', ').join(key)
 
+def parse_min_support(value: str) -> int | float | None:
+    """
+    Form value for the minimum support of a combo
+        - '' -> None (no pruning)
+        - '3' -> 3 (at least 3 lineups)
+        - '2.5%' -> 2.5 (at least 2.5% of lineups)
+    """
+    value = value.strip()
+    if not len(value):
+        return None
+
+    if value.endswith('%'):
+        return float(value[:-1])
+
+    return int(value)
+
 def run_ComboCounter(
     df: pd.DataFrame,
     option: int,
     sport: str,
     mode: str,
     num_results: int,
-    percents: bool
+    percents: bool,
+    min_support: int | float | None = None,
+    labels: dict | None = None
 ) -> dict[str,int]:
     """
     Runs the combocounter code
@@ -214,55 +360,40 @@ def run_ComboCounter(
         - Reading from a csv treates a tuple of strings as a single string
     Potentially may need to do some file caching similar to Field if want to use
     CC on lineup sets much bigger than 150
+    min_support (count or percent, see parse_min_support) drops rare combos and stops extending them to deeper levels
+    labels: players in df can be keyed by DK player ID, labels gives their names for the output
     """
     columns = PLAYER_COLUMNS[sport][mode]
     lineups = tuple(df[columns].apply(tuple, axis=1))
 
-    cc = ComboCounter(lineups, k=len(columns)-1)
-    cc.run()
-    counts = {
-        level: dict(sorted(
-            {adjust_key(k): v for k,v in innerdict.items()}.items(),
-            key=lambda item: item[1],
-            reverse=True
-        ))
-        for level, innerdict in cc.counts().items()
-    }
+    cc = ComboCounter(lineups, k=len(columns)-1, min_support=min_support, labels=labels)
 
-    ret = dict([item for item in counts[option].items()][:num_results])
+    # Only the requested level is counted and ranked, and only the returned rows get their keys joined
+    return {adjust_key(combo): count for combo, count in cc.top(option, num_results, percents=percents).items()}
 
-    if percents:
-        n_lineups = len(lineups)
-        return {k: round(100*v/n_lineups, 2) for k,v in ret.items()}
-
-    return ret
+@app.route('/cache-stats')
+def cache_stats():
+    return jsonify(FIELD_CACHE.stats())
 
 @app.route('/available-files')
 @app.route('/available-files/<tournament>')
 def get_available_files(tournament=None):
     """Return list of available files in the data directory or tournament subdirectory"""
     try:
-        if tournament:
-            # Use the tournament subdirectory path
-            directory = os.path.join(DATA_DIR, tournament)
-        else:
-            # Use the default directory
-            # Doesnt make sense at the moment, may cause issues if getting 0 results but everything works
-            directory = DATA_DIR
+        # Tournament subdirectory, or the default directory without one
+        # Default doesnt make sense at the moment, may cause issues if getting 0 results but everything works
+        directory = tournament_directory(tournament)
 
         # Check if directory exists
-        if not os.path.exists(directory):
-            return jsonify({'error': f'Directory {directory} not found'}), 404
-
-        # Get files and strip .csv extension
-        files = sorted([
-            os.path.splitext(f)[0]
-            for f in os.listdir(directory)
-            if all([
-                f.endswith('.csv'),
-                f.split('/')[-1].split('.')[0] not in HIDDEN
-            ])
-        ], key=lambda file_: file_.split('/')[-1][0].lower())
+        if directory is None or not os.path.isdir(directory):
+            return jsonify({'error': f'Directory {tournament} not found'}), 404
+
+        # Listing comes from the directory's compiled store (names without .csv, ordered by first letter)
+        files = [
+            file_
+            for file_ in load_corpus_store(directory).listing()
+            if file_ not in HIDDEN
+        ]
 
         return jsonify({'files': files})
     except Exception as e:
@@ -351,7 +482,8 @@ def analyze_max_entries():
                 return jsonify({'error': 'Please upload a CSV file'}), 400
             field = get_or_create_field(file=file, sport=sport, mode=mode)
 
-        max_entries_dict = field.max_entries()
+        # Copy, the field's result is shared between requests
+        max_entries_dict = dict(field.max_entries())
         if max_entries_dict.get('jdeegs99') is None:
             max_entries_dict['jdeegs99'] = max(max_entries_dict.values())
 
@@ -432,6 +564,9 @@ def analyze_duplicates():
 
         sport = str(request.form.get('sport', 'PGA'))
         mode = str(request.form.get('mode', 'classic')).lower()
+        min_dupes = str(request.form.get('minDupes', ''))
+        top_k = str(request.form.get('topK', ''))
+        contestant = str(request.form.get('contestant', ''))
 
         # Get the field instance
         if using_cached_file:
@@ -444,18 +579,34 @@ def analyze_duplicates():
                 return jsonify({'error': 'Please upload a CSV file'}), 400
             field = get_or_create_field(file=file, sport=sport, mode=mode)
 
-        # Get duplicates
-        # dupes_df = field.duplicates()
+        # Get duplicates, the default cut-off (more than 5 entries, all of them) is precomputed
+        if len(min_dupes) or len(top_k):
+            dupes_df = field.duplicates(
+                min_dupes=int(min_dupes) if len(min_dupes) else 6,
+                top_k=int(top_k) if len(top_k) else None
+            )
+        else:
+            dupes_df = field.duplicates()
 
-        duplicated_lineups = sorted([
+        duplicated_lineups = [
             {"lineup": ", ".join(lineup_), "entries": int(count_)}
-            for lineup_, count_ in field.duplicates()['count'].items()
-        ], key=lambda item: item['entries'], reverse=True)
+            for lineup_, count_ in dupes_df['count'].items()
+        ]
 
-        return jsonify({
+        response = {
             'success': True,
             'duplicates': duplicated_lineups
-        })
+        }
+
+        # Which of the contestant's lineups were duplicated, and how many times
+        if len(contestant):
+            response['contestant'] = contestant
+            response['contestant_duplicates'] = [
+                {"lineup": ", ".join(lineup_), "own_entries": int(row_['entries']), "entries": int(row_['count'])}
+                for lineup_, row_ in field.contestant_duplicates(contestant).iterrows()
+            ]
+
+        return jsonify(response)
 
     except Exception as e:
         import traceback
@@ -513,6 +664,171 @@ def analyze_leverage():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/analyze-leverage-batch', methods=['POST'])
+def analyze_leverage_batch():
+    try:
+        # Check if using a cached file or a new upload
+        using_cached_file = False
+
+        if 'file' not in request.files and 'file_id' in session:
+            using_cached_file = True
+
+        if not using_cached_file and ('file' not in request.files or request.files['file'].filename == ''):
+            return jsonify({'error': 'No file uploaded'}), 400
+
+        sport = str(request.form.get('sport', 'PGA'))
+        mode = str(request.form.get('mode', 'classic')).lower()
+        contestant = str(request.form.get('contestant', ''))
+        player = str(request.form.get('player', ''))
+
+        # Get the field instance
+        if using_cached_file:
+            field = get_or_create_field(sport=sport, mode=mode)
+            if field is None:
+                return jsonify({'error': 'No cached file available. Please upload a file.'}), 400
+        else:
+            file = request.files['file']
+            if not file.filename.endswith('.csv'):
+                return jsonify({'error': 'Please upload a CSV file'}), 400
+            field = get_or_create_field(file=file, sport=sport, mode=mode)
+
+        # Every requested contestant in one call, max entrants by default
+        select_contestants = [name_.strip() for name_ in contestant.split(',')] if len(contestant) else None
+        df_leverage = field.leverage_matrix(select_contestants)
+
+        if len(player):
+            select_players = [name_.strip() for name_ in player.split(',')]
+            df_leverage = df_leverage.loc[:, df_leverage.columns.isin(select_players)]
+
+        leverage = {
+            str(name_): [{"player": player_, "leverage": float(leverage_)} for player_, leverage_ in row_.sort_values(ascending=False).items()]
+            for name_, row_ in df_leverage.iterrows()
+        }
+
+        return jsonify({
+            'success': True,
+            'contestants': list(leverage),
+            'leverage': leverage
+        })
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/analyze-exposures', methods=['POST'])
+def analyze_exposures():
+    try:
+        # Check if using a cached file or a new upload
+        using_cached_file = False
+
+        if 'file' not in request.files and 'file_id' in session:
+            using_cached_file = True
+
+        if not using_cached_file and ('file' not in request.files or request.files['file'].filename == ''):
+            return jsonify({'error': 'No file uploaded'}), 400
+
+        sport = str(request.form.get('sport', 'PGA'))
+        mode = str(request.form.get('mode', 'classic')).lower()
+        contestant = str(request.form.get('contestant', ''))
+        player = str(request.form.get('player', ''))
+        num_results = int(request.form.get('numResults', '25'))
+
+        # Get the field instance
+        if using_cached_file:
+            field = get_or_create_field(sport=sport, mode=mode)
+            if field is None:
+                return jsonify({'error': 'No cached file available. Please upload a file.'}), 400
+        else:
+            file = request.files['file']
+            if not file.filename.endswith('.csv'):
+                return jsonify({'error': 'Please upload a CSV file'}), 400
+            field = get_or_create_field(file=file, sport=sport, mode=mode)
+
+        response = {'success': True}
+
+        # A contestant's exposures (row of the exposure cube)
+        if len(contestant):
+            exposures = field.contestant_exposures(contestant)
+            if exposures is None:
+                return jsonify({'error': f'{contestant} did not compete in this contest.'}), 400
+
+            response['contestant'] = contestant
+            response['exposures'] = [{"player": name_, "exposure": float(exposure_)} for name_, exposure_ in exposures.items()]
+
+        # Who is heaviest on a player (column of the exposure cube)
+        if len(player):
+            response['player'] = player
+            response['heaviest'] = [
+                {"contestant": str(name_), "exposure": float(exposure_)}
+                for name_, exposure_ in field.heaviest_on(player, num_results).items()
+            ]
+
+        return jsonify(response)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/analyze-field-combos', methods=['POST'])
+def analyze_field_combos():
+    try:
+        # Check if using a cached file or a new upload
+        using_cached_file = False
+
+        if 'file' not in request.files and 'file_id' in session:
+            using_cached_file = True
+
+        if not using_cached_file and ('file' not in request.files or request.files['file'].filename == ''):
+            return jsonify({'error': 'No file uploaded'}), 400
+
+        sport = str(request.form.get('sport', 'PGA'))
+        mode = str(request.form.get('mode', 'classic')).lower()
+        level = int(request.form.get('option', '2'))
+        num_results = int(request.form.get('numResults', '25'))
+        contestant = str(request.form.get('contestant', ''))
+
+        # Get the field instance
+        if using_cached_file:
+            field = get_or_create_field(sport=sport, mode=mode)
+            if field is None:
+                return jsonify({'error': 'No cached file available. Please upload a file.'}), 400
+        else:
+            file = request.files['file']
+            if not file.filename.endswith('.csv'):
+                return jsonify({'error': 'Please upload a CSV file'}), 400
+            field = get_or_create_field(file=file, sport=sport, mode=mode)
+
+        top, over_under = field.combos(level, num_results)
+
+        combos = [
+            {"combo": adjust_key(combo_), "entries": int(row_['count']), "percent": round(float(row_['pct']), 2)}
+            for combo_, row_ in top.iterrows()
+        ]
+
+        # Over/under for the requested contestants, max entrants by default
+        if len(contestant):
+            select_contestants = [name_.strip() for name_ in contestant.split(',')]
+        else:
+            select_contestants = list(field.max_entries())
+
+        contestants = {
+            str(name_): {adjust_key(combo_): round(float(diff_), 2) for combo_, diff_ in over_under.loc[name_].items()}
+            for name_ in select_contestants
+            if name_ in over_under.index
+        }
+
+        return jsonify({
+            'success': True,
+            'combos': combos,
+            'contestants': contestants
+        })
+
+    except Exception as e:
+        import traceback
+        print("Exception in analyze_field_combos:", str(e))
+        print(traceback.format_exc())
+        return jsonify({'error': f"Error in analyze_field_combos: {str(e)}"}), 500
+
 @app.route('/export-ownership', methods=['POST'])
 def export_ownership():
     """Server-side export option if needed"""
@@ -630,20 +946,14 @@ def process_file():
             if not selected_file:
                 return jsonify({'error': 'No file selected from directory'}), 400
 
-            # Build the file path
-            if tournament and tournament != 'none':
-                file_path = os.path.join(DATA_DIR, tournament, selected_file + '.csv')
-            else:
-                file_path = os.path.join(DATA_DIR, selected_file + '.csv')
-
-            if not os.path.exists(file_path):
+            # The directory's compiled store has every file already parsed and encoded
+            directory = tournament_directory(tournament)
+            if directory is None or not os.path.isdir(directory):
                 return jsonify({'error': 'Selected file not found'}), 400
 
-            with open(file_path, 'rb') as f:
-                file_content = f.read()
-
-        # Create BytesIO object for pandas to read
-        file_buffer = io.BytesIO(file_content)
+            store = load_corpus_store(directory)
+            if selected_file not in store.files:
+                return jsonify({'error': 'Selected file not found'}), 400
 
         option = int(request.form.get('option', '1'))
         sport = str(request.form.get('sport', 'PGA'))
@@ -651,14 +961,14 @@ def process_file():
         num_results = int(request.form.get('numResults', '50'))
         percents = str(request.form.get('percents', 'No')) == 'Yes'
         is_dk_file = str(request.form.get('is_dk_file', 'No')) == 'Yes'
+        min_support = parse_min_support(str(request.form.get('minSupport', '')))
 
-        # Check if it's a DK file by looking at first few columns
+        # Check if it's a DK file from the header line alone (recorded in the store for directory files)
         try:
-            check_df = pd.read_csv(file_buffer, nrows=1)
-            detected_dk = any('Entry ID' in cols for cols in check_df.columns)
-
-            # Reset buffer position after checking
-            file_buffer.seek(0)
+            if data_source == 'upload':
+                detected_dk = ProcessDraftKingsFile.is_dk_header(file_content[:4096])
+            else:
+                detected_dk = store.files[selected_file]['is_dk']
 
             if detected_dk != is_dk_file:
                 correct_type = "DraftKings" if detected_dk else "custom"
@@ -667,16 +977,16 @@ def process_file():
                 }), 400
 
         except Exception as e:
-            # Reset buffer position on error too
-            file_buffer.seek(0)
             return jsonify({'error': f'Error reading file format: {str(e)}'}), 400
 
-        # Process with the verified file type
-        # Create a new buffer to ensure it's not been consumed
-        fresh_buffer = io.BytesIO(file_content)
-        df = ProcessDraftKingsFile(fresh_buffer, sport, mode, is_dk_file).lineups
-
-        result = run_ComboCounter(df, option, sport, mode, num_results, percents)
+        # Process with the verified file type, straight from the bytes already read
+        if data_source == 'upload':
+            # DK files are counted on player IDs, names only come back in the output
+            processed = ProcessDraftKingsFile(file_content, sport, mode, is_dk_file)
+            result = run_ComboCounter(processed.keys, option, sport, mode, num_results, percents, min_support, labels=processed.labels)
+        else:
+            df = store.lineups(selected_file, PLAYER_COLUMNS[sport][mode])
+            result = run_ComboCounter(df, option, sport, mode, num_results, percents, min_support)
 
         return jsonify({
             'success': True,
@@ -688,5 +998,59 @@ def process_file():
         print(traceback.format_exc())  # Print detailed error for debugging
         return jsonify({'error': "Please ensure that you have the correct options selected. If you do have all the correct options but the error persists, please email me the issue."}), 500
 
+@app.route('/analyze-tournament-combos', methods=['POST'])
+def analyze_tournament_combos():
+    """Combos of every max-entry file of a tournament in one go, per contestant and pool-wide"""
+    try:
+        tournament = request.form.get('tournament')
+        sport = str(request.form.get('sport', 'PGA'))
+        mode = str(request.form.get('mode', 'classic')).lower()
+        level = int(request.form.get('option', '2'))
+        num_results = int(request.form.get('numResults', '25'))
+
+        if not tournament or tournament == 'none':
+            return jsonify({'error': 'No tournament selected'}), 400
+
+        directory = tournament_directory(tournament)
+        if directory is None or not os.path.isdir(directory):
+            return jsonify({'error': f'Tournament {tournament} not found'}), 404
+
+        # Every file comes from the directory's compiled store, parsed once with one player dictionary
+        store = load_corpus_store(directory)
+        files = [file_ for file_ in store.listing() if file_ not in HIDDEN]
+
+        contestants, pool, shares = tournament_combos(
+            store,
+            PLAYER_COLUMNS[sport][mode],
+            files=files,
+            level=level,
+            top_n=num_results,
+            exclude=('LOCKED',)
+        )
+
+        combos = [
+            {
+                "combo": adjust_key(combo_),
+                "entries": int(row_['count']),
+                "percent": round(float(row_['pct']), 2),
+                # Share of the combo's pool entries coming from each contestant that played it
+                "shares": {str(name_): round(float(share_), 2) for name_, share_ in shares.loc[[combo_]].iloc[0].items() if share_ > 0}
+            }
+            for combo_, row_ in pool.iterrows()
+        ]
+
+        return jsonify({
+            'success': True,
+            'tournament': tournament,
+            'contestants': {str(name_): {adjust_key(combo_): count_ for combo_, count_ in top_.items()} for name_, top_ in contestants.items()},
+            'pool': combos
+        })
+
+    except Exception as e:
+        import traceback
+        print("Exception in analyze_tournament_combos:", str(e))
+        print(traceback.format_exc())
+        return jsonify({'error': f"Error in analyze_tournament_combos: {str(e)}"}), 500
+
 if __name__ == '__main__':
     app.run(debug=True)
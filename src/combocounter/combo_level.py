@@ -0,0 +1,153 @@
+import numpy as np
+
+
+class ComboLevel:
+    """
+    One level of ComboCounterDict: packed combo keys and their counts as two parallel arrays, sorted by key
+        - A key is a void scalar of 2*level bytes (ascending IDs, 2 big-endian bytes each, see ComboCounterDict.pack),
+          void compares bytewise, so key order == ID order and lookups are binary searches
+        - 2*level + 8 bytes per combo, a dict entry with a bytes key is well over 100
+        - Writes come in bulk (engine results, deltas of added/removed lineups) and build new arrays
+        - Player index (player ID -> rows of the combos containing them) is built on the first query, dropped by writes
+    """
+
+    def __init__(self, level: int, keys: np.ndarray | None = None, counts: np.ndarray | None = None):
+
+        self.level = level
+        self.dtype = np.dtype((np.void, 2*level))
+
+        self.keys = np.empty(0, dtype=self.dtype) if keys is None else keys
+        self.counts = np.empty(0, dtype=np.int64) if counts is None else counts
+
+        self.__index = None
+
+    @classmethod
+    def from_arrays(cls, level: int, keys: np.ndarray, counts: np.ndarray) -> 'ComboLevel':
+        """
+        Keys in any order, counts of a repeated key are added up and keys left at 0 or below are dropped
+        """
+        if not len(keys):
+            return cls(level)
+
+        unique, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse.ravel(), weights=counts, minlength=len(unique)).round().astype(np.int64)
+
+        keep = counts > 0
+        return cls(level, unique[keep], counts[keep])
+
+    @classmethod
+    def from_dict(cls, level: int, counts: dict) -> 'ComboLevel':
+        """
+        {packed key: count}, as returned by the engines' count_level() or held by a SpaceSaving summary
+        """
+        keys = np.frombuffer(b''.join(counts), dtype=np.dtype((np.void, 2*level)))
+        return cls.from_arrays(level, keys, np.fromiter(counts.values(), dtype=np.int64, count=len(counts)))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @property
+    def nbytes(self) -> int:
+        return self.keys.nbytes + self.counts.nbytes
+
+    def ids(self) -> np.ndarray:
+        """
+        (combos, level) player IDs of every key
+        """
+        return self.keys.view('>u2').reshape(len(self.keys), self.level)
+
+    def find(self, key: bytes) -> int:
+        """
+        Row of a packed key, -1 if it is not held
+        """
+        row = int(np.searchsorted(self.keys, np.frombuffer(key, dtype=self.dtype)[0]))
+        return row if row < len(self.keys) and self.keys[row].tobytes() == key else -1
+
+    def __contains__(self, key: bytes) -> bool:
+        return self.find(key) >= 0
+
+    def __getitem__(self, key: bytes) -> int:
+        row = self.find(key)
+        if row < 0:
+            raise KeyError(key)
+
+        return int(self.counts[row])
+
+    def get(self, key: bytes, default=0):
+        row = self.find(key)
+        return int(self.counts[row]) if row >= 0 else default
+
+    def items(self):
+        return zip(self.keys.tolist(), self.counts.tolist())
+
+    def __set_arrays(self, keys: np.ndarray, counts: np.ndarray) -> None:
+        self.keys, self.counts = keys, counts
+        self.__index = None
+
+    def set(self, key: bytes, count: int) -> None:
+        row = self.find(key)
+        if row >= 0:
+            counts = self.counts.copy()
+            counts[row] = count
+            self.__set_arrays(self.keys, counts)
+            return
+
+        row = int(np.searchsorted(self.keys, np.frombuffer(key, dtype=self.dtype)[0]))
+        self.__set_arrays(
+            np.insert(self.keys, row, np.frombuffer(key, dtype=self.dtype)),
+            np.insert(self.counts, row, count)
+        )
+
+    def add(self, other: 'ComboLevel', sign: int = 1) -> None:
+        """
+        Adds (sign=1) or subtracts (sign=-1) another level's counts, combos that drop to 0 are removed
+        """
+        if not len(other):
+            return
+
+        if not len(self) and sign > 0:
+            self.__set_arrays(other.keys, other.counts)
+            return
+
+        merged = self.from_arrays(
+            self.level,
+            np.concatenate([self.keys, other.keys]),
+            np.concatenate([self.counts, sign * other.counts])
+        )
+        self.__set_arrays(merged.keys, merged.counts)
+
+    def containing(self, id_: int) -> np.ndarray:
+        """
+        Rows (ascending) of the combos that include a player ID
+        The index is one stable argsort of every key's IDs, so a query only touches the player's own combos
+        """
+        if self.__index is None:
+            flat = self.ids().ravel()
+            order = np.argsort(flat, kind='stable')
+            self.__index = (flat[order], (order // self.level).astype(np.int32))
+
+        ids, rows = self.__index
+        start, stop = np.searchsorted(ids, id_, side='left'), np.searchsorted(ids, id_, side='right')
+
+        # A combo holding a player twice (LOCKED) is in the index twice
+        return np.unique(rows[start:stop])
+
+    def ranked(self, rows: np.ndarray | None = None, n: int | None = None) -> np.ndarray:
+        """
+        Rows (default: all of them) most common first, ties by key
+            - IDs are handed out in order of first appearance in the lineups, so a tie goes to the combo
+              whose players showed up earlier, whichever engine counted the level
+        n: only the first n, everything below the n-th biggest count is dropped before sorting
+        """
+        rows = np.arange(len(self.keys)) if rows is None else np.sort(rows)
+        counts = self.counts[rows]
+
+        if n is not None and n < len(rows):
+            if n <= 0:
+                return rows[:0]
+
+            cutoff = np.partition(counts, len(counts)-n)[len(counts)-n]
+            rows, counts = rows[counts >= cutoff], counts[counts >= cutoff]
+
+        # Rows are in key order, so a stable sort on the count keeps tied rows in key order
+        return rows[np.argsort(-counts, kind='stable')][:n]
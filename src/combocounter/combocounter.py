@@ -1,118 +1,493 @@
 import itertools
+import math
+import struct
+
+import numpy as np
+
+from .combo_level import ComboLevel
+from .engines import ENGINES
+from .heavy_hitters import SpaceSaving
+from .sharding import count_sharded
+
+def min_support_count(min_support: int | float | None, n_lineups: int) -> int | None:
+    """
+    Converts a min_support option into the minimum number of lineups a combo has to appear in
+        - int: absolute count (3 -> at least 3 lineups)
+        - float: percent of lineups (2.5 -> at least 2.5% of lineups)
+    """
+    if min_support is None:
+        return None
+
+    if isinstance(min_support, float):
+        return max(1, math.ceil(min_support * n_lineups / 100))
+
+    return max(1, int(min_support))
 
 class ComboCounterDict:
-    def __init__(self, *, k: int):
+    """
+    Combo counts, one ComboLevel (sorted key and count arrays) per level
+        - Player names are interned to integer IDs (self.ids: name -> ID, self.names: ID -> name)
+        - A combo is stored as a packed key: its IDs in ascending order, 2 big-endian bytes each
+          (fixed width, and byte order == ID order, so it is canonical without sorting names)
+        - Names are only decoded when results are presented
+        - A player can be keyed by something other than its name (e.g. DK player ID), labels maps such keys
+          to the name shown in results, and names work for lookups as well as keys
+        - Levels that get queried by player keep an inverted index (player ID -> combos containing them), see containing()
+    """
+
+    # IDs are packed as unsigned shorts
+    MAX_PLAYERS = 2**16
+
+    def __init__(self, *, k: int, labels: dict | None = None):
         self.__k = k
-        self.__data = {k: dict() for k in range(1,k+1)}
+        self.__data = {k: ComboLevel(k) for k in range(1,k+1)}
+
+        self.names = []
+        self.ids = {}
+
+        # {player key: display name}, and the reverse for lookups by name (built when first needed)
+        self.labels = dict(labels or {})
+        self.__keys_by_label = None
 
     @staticmethod
     def level(key):
-        return 1 if isinstance(key, str) or len(key) == 1 else len(key)
+        return len(key) if isinstance(key, (tuple, list)) else 1
 
     @staticmethod
-    def parse_key(key):
-
-        # If single person key, just return it
-        if isinstance(key, str):
-            return key
+    def pack(ids) -> bytes:
+        return struct.pack(f'>{len(ids)}H', *sorted(ids))
 
-        # Otherwise its a tuple
-        # Quick linting in case tuple with len == 1
-        return key[0] if len(key) == 1 else tuple(sorted(key))
+    @staticmethod
+    def unpack(key: bytes) -> tuple[int,...]:
+        return struct.unpack(f'>{len(key)//2}H', key)
+
+    def intern(self, name) -> int:
+        """
+        ID of name, adding it to the table if it has not been seen yet
+        """
+        id_ = self.ids.get(name)
+
+        if id_ is None:
+            if len(self.names) >= self.MAX_PLAYERS:
+                raise ValueError(f'ComboCounterDict supports at most {self.MAX_PLAYERS} distinct players')
+
+            id_ = self.ids[name] = len(self.names)
+            self.names.append(name)
+
+        return id_
+
+    def intern_lineups(self, names2d) -> list[tuple[int,...]]:
+        """
+        Lineups to rows of IDs, every distinct name goes through intern() once (in order of first appearance)
+        """
+        ids = {name: self.intern(name) for name in dict.fromkeys(itertools.chain.from_iterable(names2d))}
+        return [tuple(map(ids.__getitem__, names)) for names in names2d]
+
+    def label(self, name):
+        return self.labels.get(name, name)
+
+    def lookup(self, name) -> int:
+        """
+        ID of a player by key, or by label when players are keyed by something else
+        Raises KeyError for a player that was never counted
+        """
+        if name in self.ids:
+            return self.ids[name]
+
+        if self.__keys_by_label is None or len(self.__keys_by_label) != len(self.labels):
+            self.__keys_by_label = {label: key for key, label in self.labels.items()}
+
+        return self.ids[self.__keys_by_label[name]]
+
+    def parse_key(self, key, *, add=False) -> bytes:
+        """
+        Packed key for a name or tuple of names (in any order)
+        Raises KeyError for a name that was never counted, unless add=True
+        """
+
+        # If single person key, make it a tuple of one
+        names = key if isinstance(key, (tuple, list)) else (key,)
+
+        return self.pack([self.intern(name) if add else self.lookup(name) for name in names])
+
+    def decode(self, key: bytes):
+        """
+        Packed key back to the original layout: name at level 1, alphabetically sorted tuple of names above it
+        Keys with a label are shown by it
+        """
+        names = [self.label(self.names[id_]) for id_ in self.unpack(key)]
+        return names[0] if len(names) == 1 else tuple(sorted(names))
+
+    def translate(self, counts: ComboLevel, other: 'ComboCounterDict') -> ComboLevel:
+        """
+        Re-keys a level of counts packed with another ComboCounterDict's IDs into this one's IDs
+        """
+        ids = np.array([self.intern(name) for name in other.names], dtype=np.int64)
+        if not len(counts):
+            return ComboLevel(counts.level)
+
+        rekeyed = np.ascontiguousarray(np.sort(ids[counts.ids()], axis=1).astype('>u2'))
+        return ComboLevel.from_arrays(counts.level, rekeyed.view(counts.dtype).ravel(), counts.counts)
 
     def __setitem__(self, key, value: int) -> None:
-        self.__data[self.level(key)][self.parse_key(key)] = value
+        self.__data[self.level(key)].set(self.parse_key(key, add=True), value)
         return
 
     def __getitem__(self, key) -> int:
         return self.__data[self.level(key)][self.parse_key(key)]
 
     def get(self, key, default=0):
-        return self.__data[self.level(key)].get(self.parse_key(key), default)
+        try:
+            return self.__data[self.level(key)].get(self.parse_key(key), default)
+        except KeyError:
+            return default
+
+    def add_counts(self, level: int, counts: ComboLevel | dict, sign: int = 1) -> None:
+        """
+        Bulk add (sign=1) or subtract (sign=-1, removed lineups) of already canonical keys, as returned by an engine
+        """
+        if isinstance(counts, dict):
+            counts = ComboLevel.from_dict(level, counts)
+
+        self.__data[level].add(counts, sign)
+
+    def clear(self, level: int) -> None:
+        self.__data[level] = ComboLevel(level)
+
+    def replace(self, level: int, counts: dict) -> None:
+        """
+        Swaps in a whole level of already canonical keys
+        """
+        self.__data[level] = ComboLevel.from_dict(level, counts)
+
+    def containing(self, level: int, name) -> np.ndarray:
+        """
+        Rows of the level's combos that include the player (see ComboLevel.containing)
+        The level's index is built the first time, and rebuilt on the next query after a write
+        """
+        try:
+            id_ = self.lookup(name)
+        except KeyError:
+            return np.empty(0, dtype=np.int32)
+
+        return self.__data[level].containing(id_)
 
     def data(self):
         return self.__data
 
 class ComboCounter:
 
-    def __init__(self, names2d: tuple[tuple[str,...],...], *, k:int):
+    def __init__(
+            self,
+            names2d: tuple[tuple[str,...],...],
+            *,
+            k:int,
+            engine: str = 'python',
+            min_support: int | float | None = None,
+            workers: int = 1,
+            shard_threshold: int = 20_000,
+            capacity: int | None = None,
+            chunk_size: int = 5_000,
+            labels: dict | None = None
+        ):
+
+        if engine not in ENGINES:
+            raise ValueError(f'Unknown engine "{engine}", options are: {", ".join(ENGINES)}')
+
+        if capacity is not None and min_support is not None:
+            raise ValueError('min_support can not be combined with approximate counting (capacity)')
 
         # Quick linting needed?
-        self.names2d = names2d
+        # List so lineups can be added/removed later on
+        self.names2d = list(names2d)
         self.__k = k
-        self.cc_dict = ComboCounterDict(k=k)
+        self.engine = engine
+        # Lineups can hold any hashable player key (e.g. DK player IDs), labels gives their names for results
+        self.cc_dict = ComboCounterDict(k=k, labels=labels)
+
+        # Same lineups as player IDs, which is all the engines ever see
+        self.rows = self.cc_dict.intern_lineups(self.names2d)
+
+        # Combos below min_count are never stored, and never extended to deeper levels
+        self.min_support = min_support
+        self.min_count = min_support_count(min_support, len(names2d))
+
+        # Sets of at least shard_threshold lineups are split across worker processes (exact counting only)
+        self.workers = workers
+        self.shard_threshold = shard_threshold
+
+        # Approximate mode: every level is a SpaceSaving summary holding at most capacity combos
+        # Lineups are counted exactly chunk_size at a time and folded in, so memory never depends on the number of lineups
+        self.capacity = capacity
+        self.chunk_size = chunk_size
+        self.__summaries = {}
+
+        # Levels are only counted when something asks for them, see materialize()
+        self.__engine = None
+        self.__materialized = set()
+
+        # Sorted views handed out by counts(), keyed by (level, percents)
+        # Percent views were built with n_views_lineups lineups
+        self.__views = {}
+        self.__n_views_lineups = len(self.names2d)
 
     def __setitem__(self, key, value: int) -> None:
+        level = ComboCounterDict.level(key)
+        self.materialize(level)
         self.cc_dict[key] = value
+        self.__invalidate([level])
         return
 
     def __getitem__(self, key) -> int:
+        self.materialize(ComboCounterDict.level(key))
         return self.cc_dict[key]
 
     def get(self, key, default=0):
+        self.materialize(ComboCounterDict.level(key))
         return self.cc_dict.get(key, default)
 
-    def run(self):
-        # Sometimes not going to run, instead will use iteratively
-        for names in self.names2d:
+    @property
+    def materialized(self) -> tuple[int,...]:
+        """
+        Levels that have been counted so far
+        """
+        return tuple(sorted(self.__materialized))
+
+    def materialize(self, *levels: int) -> None:
+        """
+        Counts levels that have not been counted yet (memoized per instance)
+        With min_support, the levels below them are needed first (only frequent combos get extended)
+        """
+        for level in levels:
+            if not 1 <= level <= self.__k:
+                raise ValueError(f'Level must be between 1 and {self.__k}, got {level}')
+
+        if self.min_count is not None and len(levels):
+            levels = range(1, max(levels)+1)
+
+        levels = [level for level in levels if level not in self.__materialized]
+        if not len(levels):
+            return
+
+        if self.capacity is not None:
+            self.__summarize(self.rows, levels)
+            self.__materialized.update(levels)
+            return
+
+        for level, counts in self.__count(self.rows, levels).items():
+            self.cc_dict.add_counts(level, counts)
+            self.__materialized.add(level)
+
+    def __count(self, rows: list[tuple[int,...]], levels: list[int]) -> dict[int,ComboLevel]:
+        """
+        Counts levels over rows of player IDs, sharded across processes when it is big enough to be worth it
+        The engine over self.rows is kept around for the next materialize()
+        """
+        if self.min_count is None and self.workers > 1 and len(rows) >= self.shard_threshold:
+            return {
+                level: ComboLevel.from_dict(level, counts)
+                for level, counts in count_sharded(self.engine, rows, levels, self.workers).items()
+            }
 
-            for name in names:
-                self.cc_dict[name] = self.cc_dict.get(name, 0) + 1
+        if rows is not self.rows:
+            engine = ENGINES[self.engine](rows)
+            return {level: ComboLevel.from_arrays(level, *engine.count_keys(level)) for level in levels}
 
-            for k in range(2, self.__k+1):
+        if self.__engine is None:
+            self.__engine = ENGINES[self.engine](self.rows)
 
-                for combo in [tuple(combo_) for combo_ in itertools.combinations(names, k)]:
-                    self.cc_dict[combo] = self.cc_dict.get(combo, 0) + 1
+        return {level: ComboLevel.from_arrays(level, *self.__engine.count_keys(level, self.min_count)) for level in levels}
 
-    def counts(self, percents=False):
+    def __summarize(self, rows: list[tuple[int,...]], levels: list[int]) -> None:
+        """
+        Approximate counting: folds rows into the levels' SpaceSaving summaries one exactly counted chunk at a time
+        """
+        for level in levels:
+            self.__summaries.setdefault(level, SpaceSaving(self.capacity))
 
+        for start in range(0, len(rows), self.chunk_size):
+            engine = ENGINES[self.engine](rows[start:start+self.chunk_size])
+            for level in levels:
+                self.__summaries[level].update(engine.count_level(level))
 
-        if percents:
-            if hasattr(self, 'sorted_percents'):
-                return self.sorted_percents
-
-            self.sorted = {
-                level: dict(sorted(
-                    {k: v for k,v in innerdict.items()}.items(),
-                    key=lambda item: item[1],
-                    reverse=True
-                ))
-                for level, innerdict in self.cc_dict.data().items()
-            }
+        for level in levels:
+            self.cc_dict.replace(level, self.__summaries[level].counts)
 
-            n_lineups = len(self.names2d)
+    def run(self):
+        self.materialize(*range(1, self.__k+1))
 
-            self.sorted_percents = {
-                level: {
-                    combo: round(100*count/n_lineups, 2)
-                    for combo, count in combo_count.items()
-                }
-                for level, combo_count in self.sorted.items()
-            }
+    def __view(self, level: int, percents: bool) -> dict:
+        """
+        Sorted (and optionally percent) version of a single level, cached until that level changes
+        Most common first, ties by packed key (see ComboLevel.ranked)
+        """
+        if (level, percents) in self.__views:
+            return self.__views[(level, percents)]
 
-            return self.sorted_percents
+        combos = self.cc_dict.data()[level]
+        decode = self.cc_dict.decode
 
-        if hasattr(self, 'sorted'):
-            return self.sorted
+        ranked = combos.ranked()
+        items = zip(combos.keys[ranked].tolist(), combos.counts[ranked].tolist())
 
-        # Don't want to have to sort every time it is called
-        # Three dictcomps in one (with a fourth built-into an equation!) --> pretty dope
-        self.sorted = {
-            level: dict(sorted(
-                {k: v for k,v in innerdict.items() if v > {3:0,4:0}.get(level,0)}.items(),
-                key=lambda item: item[1],
-                reverse=True
-            ))
-            for level, innerdict in self.cc_dict.data().items()
+        if percents:
+            n_lineups = len(self.names2d)
+            view = {decode(combo): round(100*count/n_lineups, 2) for combo, count in items}
+
+        else:
+            view = {decode(combo): count for combo, count in items if count > {3:0,4:0}.get(level,0)}
+
+        self.__views[(level, percents)] = view
+        return view
+
+    def __invalidate(self, levels) -> None:
+        """
+        Drops the cached views of the given levels
+        Percent views also depend on the number of lineups, so every one of them goes if that changed
+        """
+        n_changed = self.__n_views_lineups != len(self.names2d)
+        self.__views = {
+            (level, percents): view
+            for (level, percents), view in self.__views.items()
+            if level not in levels and not (n_changed and percents)
         }
+        self.__n_views_lineups = len(self.names2d)
 
-        return self.sorted
+    def counts(self, percents=False):
 
-    def player_exposure_at_level(self, name: str, level: int):
-        if level == 1:
-            return {name_: count_ for name_, count_ in self.counts()[level].items() if name == name_}
+        # Full view of every level, don't want to have to sort every time it is called
+        self.run()
+
+        return {level: self.__view(level, percents) for level in range(1, self.__k+1)}
+
+    def __update(self, rows: list[tuple[int,...]], sign: int, source=None) -> None:
+        """
+        Adds (sign=1) or subtracts (sign=-1) the combos of rows from every materialized level
+            - Only the new lineups get counted, unless source (a ComboCounter over exactly those lineups) already has the level
+            - With min_support nothing can be patched in place (a combo can cross the threshold either way),
+              so the levels are dropped and recounted on demand
+        """
+        levels = self.materialized
+
+        self.__engine = None
+        self.min_count = min_support_count(self.min_support, len(self.names2d))
+
+        if self.min_count is not None:
+            for level in levels:
+                self.cc_dict.clear(level)
+            self.__materialized = set()
+            self.__invalidate(levels)
+            return
+
+        if self.capacity is not None:
+            self.__summarize(rows, levels)
+            self.__invalidate(levels)
+            return
+
+        reused = [level for level in levels if source is not None and source.min_count is None and level in source.materialized]
+        deltas = {
+            **{level: self.cc_dict.translate(source.cc_dict.data()[level], source.cc_dict) for level in reused},
+            **self.__count(rows, [level for level in levels if level not in reused])
+        }
 
-        return {combo_: count_ for combo_, count_ in self.counts()[level].items() if name in combo_}
+        for level, delta in deltas.items():
+            self.cc_dict.add_counts(level, delta, sign)
+
+        self.__invalidate(levels)
+
+    def add_lineups(self, lineups: tuple[tuple[str,...],...]) -> None:
+        """
+        Adds lineups and updates the counted levels in place
+        """
+        lineups = [tuple(lineup) for lineup in lineups]
+        rows = self.cc_dict.intern_lineups(lineups)
+
+        self.names2d.extend(lineups)
+        self.rows.extend(rows)
+        self.__update(rows, 1)
+
+    def remove_lineups(self, lineups: tuple[tuple[str,...],...]) -> None:
+        """
+        Removes lineups (matched by slot order, one occurrence each) and updates the counted levels in place
+        """
+        if self.capacity is not None:
+            raise ValueError('Lineups can not be removed from an approximate (capacity) ComboCounter')
+
+        lineups = [tuple(lineup) for lineup in lineups]
+
+        names2d, rows = list(self.names2d), list(self.rows)
+        removed = []
+        for lineup in lineups:
+            try:
+                index = names2d.index(lineup)
+            except ValueError:
+                raise ValueError(f'Lineup {lineup} is not in this ComboCounter')
+
+            names2d.pop(index)
+            removed.append(rows.pop(index))
+
+        self.names2d, self.rows = names2d, rows
+        self.__update(removed, -1)
+
+    def merge(self, other: 'ComboCounter') -> None:
+        """
+        Adds every lineup of another ComboCounter, reusing its counts for levels both have counted
+        """
+        lineups = list(other.names2d)
+        rows = self.cc_dict.intern_lineups(lineups)
+        self.cc_dict.labels.update(other.cc_dict.labels)
+
+        self.names2d.extend(lineups)
+        self.rows.extend(rows)
+        self.__update(rows, 1, source=other)
+
+    def top(self, level: int, n: int, percents=False, errors=False, exclude: tuple[str,...] = ()) -> dict:
+        """
+        Returns the n most common combos at a single level
+        Only the combos at or above the n-th biggest count get sorted, not the whole level like counts() does
+            - Ties keep the same order as counts() (see ComboLevel.ranked)
+        errors=True returns (count, error) pairs: the true count is between count - error and count
+        (error is always 0 unless counting is approximate, see capacity)
+        exclude skips every combo containing one of those names (e.g. LOCKED)
+        """
+        self.materialize(level)
+
+        combos = self.cc_dict.data()[level]
+
+        rows = None
+        if len(exclude):
+            excluded = np.concatenate([self.cc_dict.containing(level, name) for name in exclude])
+            rows = np.setdiff1d(np.arange(len(combos)), excluded)
+
+        ranked = combos.ranked(rows, n)
+        top_n = list(zip(combos.keys[ranked].tolist(), combos.counts[ranked].tolist()))
+
+        decode = self.cc_dict.decode
+        # No lineups means nothing to rank, and nothing to divide by
+        scale = 100/len(self.names2d) if percents and len(self.names2d) else 1
+
+        def value(count):
+            return round(scale*count, 2) if percents else count
+
+        if errors:
+            level_errors = self.__summaries[level].errors if level in self.__summaries else {}
+            return {decode(combo): (value(count), value(level_errors.get(combo, 0))) for combo, count in top_n}
+
+        return {decode(combo): value(count) for combo, count in top_n}
+
+    def player_exposure_at_level(self, name: str, level: int):
+        """
+        Combos at level that include the player, most common first
+        Only looks at the player's own combos (through the inverted index), not the whole level
+        """
+        self.materialize(level)
+        combos = self.cc_dict.data()[level]
+        ranked = combos.ranked(self.cc_dict.containing(level, name))
+
+        return {
+            self.cc_dict.decode(combo_): count_
+            for combo_, count_ in zip(combos.keys[ranked].tolist(), combos.counts[ranked].tolist())
+        }
 
     def handcuffs(self, name: str, **kwargs):
 
@@ -125,6 +500,8 @@ class ComboCounter:
                 **self.player_exposure_at_level(name, level)
             }
 
-        exposures = {k: v for k,v in exposures.items() if v > kwargs.get('cutoff', max(exposures.values()) / 2)}
+        # Default evaluated once, not for every combo inside the dictcomp
+        cutoff = kwargs['cutoff'] if 'cutoff' in kwargs else max(exposures.values(), default=0) / 2
+        exposures = {k: v for k,v in exposures.items() if v > cutoff}
 
         return exposures
@@ -0,0 +1,8 @@
+from .numpy_engine import NumpyComboEngine
+from .python_engine import PythonComboEngine
+
+# Counting engines available to ComboCounter(engine=...)
+ENGINES = {
+    'python': PythonComboEngine,
+    'numpy': NumpyComboEngine,
+}
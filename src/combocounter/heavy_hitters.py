@@ -0,0 +1,51 @@
+import numpy as np
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy hitters summary (Metwally et al.), never holds more than capacity counters
+        - counts[key] is an overestimate of the true count
+        - errors[key] bounds the overestimate: counts[key] - errors[key] <= true count <= counts[key]
+        - Any key that is not held has a true count <= floor (0 until the summary first fills up)
+    Updates are batched (weighted), so an engine can count a chunk of lineups exactly and fold the result in
+    """
+
+    def __init__(self, capacity: int):
+
+        if capacity < 1:
+            raise ValueError(f'capacity must be at least 1, got {capacity}')
+
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.floor = 0
+
+    def __trim(self) -> None:
+        """
+        Keeps the capacity biggest counters, everything dropped is <= the new floor
+        """
+        if len(self.counts) <= self.capacity:
+            return
+
+        keys = list(self.counts)
+        values = np.fromiter(self.counts.values(), dtype=np.int64, count=len(keys))
+
+        keep = np.argpartition(-values, self.capacity-1)[:self.capacity]
+        self.floor = max(self.floor, int(values[keep].min()))
+
+        self.counts = {keys[i]: int(values[i]) for i in keep.tolist()}
+        self.errors = {key: self.errors[key] for key in self.counts}
+
+    def update(self, counts: dict) -> None:
+        """
+        Adds a batch of (key, count) pairs
+        A key that is not being held could already have up to floor occurrences, so it starts from there
+        """
+        for key, count in counts.items():
+            if key in self.counts:
+                self.counts[key] += count
+            else:
+                self.counts[key] = self.floor + count
+                self.errors[key] = self.floor
+
+        self.__trim()
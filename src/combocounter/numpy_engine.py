@@ -0,0 +1,191 @@
+import itertools
+
+import numpy as np
+
+
+class NumpyComboEngine:
+    """
+    Vectorized counting engine for ComboCounter
+        - Lineups (rows of player IDs) are held as a 2D int array with every row sorted
+        - Every combo at a level is pulled out at once with a precomputed index template,
+          packed into a single key and aggregated with np.unique
+        - Results come out with the same packed keys as ComboCounterDict.pack
+    """
+
+    # Rows of combos processed at once, keeps the (rows, n_combos, level) intermediate bounded
+    MAX_COMBOS_PER_CHUNK = 2**21
+
+    def __init__(self, rows: list[tuple[int,...]]):
+
+        self.lineups = np.sort(np.asarray(rows, dtype=np.int64).reshape(len(rows), -1), axis=1) if len(rows) else np.empty((0, 0), dtype=np.int64)
+        self.n_ids = int(self.lineups.max()) + 1 if self.lineups.size else 1
+
+        # Apriori state for count_frequent(), see there
+        self.__frontier = None
+        self.__frequent_keys = None
+
+    @staticmethod
+    def template(width: int, level: int) -> np.ndarray:
+        """
+        Column indexes of every combination of size level in a row of size width
+        Example: width=4, level=2 -> [[0,1], [0,2], [0,3], [1,2], [1,3], [2,3]]
+        """
+        return np.array(list(itertools.combinations(range(width), level)), dtype=np.intp).reshape(-1, level)
+
+    def keys(self, combos: np.ndarray) -> np.ndarray:
+        """
+        One key per row of IDs, usable with np.unique / np.isin
+            - Packed into an int64 (base = highest ID + 1) when it fits
+            - Otherwise the raw bytes of the row
+        """
+        base = self.n_ids
+        level = combos.shape[1]
+
+        if base**level < 2**63:
+            return combos @ (base ** np.arange(level-1, -1, -1, dtype=np.int64))
+
+        combos = np.ascontiguousarray(combos)
+        return combos.view(np.dtype((np.void, combos.dtype.itemsize*level))).ravel()
+
+    def aggregate(self, combos: np.ndarray, weights: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Unique rows of combos with their (weighted) counts
+        """
+        keys = self.keys(combos)
+
+        if weights is None:
+            _, index, counts = np.unique(keys, return_index=True, return_counts=True)
+            return combos[index], counts
+
+        _, index, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        return combos[index], np.bincount(inverse.ravel(), weights=weights).astype(np.int64)
+
+    def count_ids(self, level: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (combos, counts) for level, where combos is a (n_unique, level) array of sorted IDs
+        """
+        if level == 1:
+            counts = np.bincount(self.lineups.ravel(), minlength=self.n_ids)
+            present = np.flatnonzero(counts)
+            return present[:, None], counts[present]
+
+        template = self.template(self.lineups.shape[1], level)
+        if not len(template) or not len(self.lineups):
+            return np.empty((0, level), dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        rows_per_chunk = max(1, self.MAX_COMBOS_PER_CHUNK // len(template))
+
+        chunk_combos, chunk_counts = [], []
+        for start in range(0, len(self.lineups), rows_per_chunk):
+            # Rows are sorted and template is increasing, so every combo is already in canonical order
+            combos = self.lineups[start:start+rows_per_chunk][:, template].reshape(-1, level)
+            unique, counts = self.aggregate(combos)
+
+            chunk_combos.append(unique)
+            chunk_counts.append(counts)
+
+        if len(chunk_combos) == 1:
+            return chunk_combos[0], chunk_counts[0]
+
+        # Combine the per-chunk results, summing counts of combos seen in more than one chunk
+        return self.aggregate(np.concatenate(chunk_combos), np.concatenate(chunk_counts))
+
+    def count_frequent(self, level: int, min_count: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Apriori version of count_ids(), only returns combos appearing in at least min_count lineups
+            - Must be called for every level in order (1, 2, 3, ...)
+            - Level k is built by extending the frequent (k-1)-combos of each lineup (the "frontier")
+              with the lineup's later players, so infrequent combos are never extended
+            - Candidates with any infrequent (k-1)-subset are dropped before counting
+            - Support is the number of lineups with the combo, which never grows with the level, so pruning is safe
+            - Returned counts are the same as count_ids(): a name repeated in a lineup (LOCKED) counts once per slot
+        """
+        if level == 1:
+            # Rows are sorted, so a repeat always sits right after its first occurrence
+            unique_slot = np.ones(self.lineups.shape, dtype=bool)
+            unique_slot[:, 1:] = self.lineups[:, 1:] != self.lineups[:, :-1]
+
+            counts = np.bincount(self.lineups.ravel(), minlength=self.n_ids)
+            support = np.bincount(self.lineups[unique_slot], minlength=self.n_ids)
+            is_frequent = (support >= min_count) & (support > 0)
+
+            rows, positions = np.nonzero(is_frequent[self.lineups])
+            self.__frontier = (rows, positions, self.lineups[rows, positions][:, None])
+
+            combos = np.flatnonzero(is_frequent)[:, None]
+            self.__frequent_keys = self.keys(combos)
+
+            return combos, counts[combos[:, 0]]
+
+        rows, positions, prefixes = self.__frontier
+        width = self.lineups.shape[1]
+
+        cand_rows, cand_positions, candidates = [], [], []
+        for offset in range(1, width):
+            extendable = positions + offset < width
+            extended = positions[extendable] + offset
+
+            cand_rows.append(rows[extendable])
+            cand_positions.append(extended)
+            candidates.append(np.hstack([prefixes[extendable], self.lineups[rows[extendable], extended][:, None]]))
+
+        rows = np.concatenate(cand_rows)
+        positions = np.concatenate(cand_positions)
+        candidates = np.concatenate(candidates)
+
+        # Prefix (dropping the last player) is frequent by construction, check the other (k-1)-subsets
+        for dropped in range(level-1):
+            subset_ok = np.isin(self.keys(np.delete(candidates, dropped, axis=1)), self.__frequent_keys)
+            rows, positions, candidates = rows[subset_ok], positions[subset_ok], candidates[subset_ok]
+
+        if not len(candidates):
+            self.__frontier = (rows, positions, candidates)
+            self.__frequent_keys = self.keys(candidates)
+            return candidates, np.empty(0, dtype=np.int64)
+
+        keys = self.keys(candidates)
+        _, index, inverse, counts = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+        inverse = inverse.ravel()
+
+        # Support: distinct lineups per combo, a lineup with a repeated name can hold the same combo more than once
+        order = np.lexsort((rows, inverse))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (inverse[order][1:] != inverse[order][:-1]) | (rows[order][1:] != rows[order][:-1])
+        support = np.bincount(inverse[order][first], minlength=len(index))
+
+        keep = support >= min_count
+        combos = candidates[index]
+        self.__frequent_keys = self.keys(combos[keep])
+
+        in_frontier = keep[inverse]
+        self.__frontier = (rows[in_frontier], positions[in_frontier], candidates[in_frontier])
+
+        return combos[keep], counts[keep]
+
+    @staticmethod
+    def packed_keys(combos: np.ndarray) -> np.ndarray:
+        """
+        (combos, level) IDs to packed keys: ascending IDs as 2 big-endian bytes each, as a void array (see ComboLevel)
+        """
+        packed = np.ascontiguousarray(combos.astype('>u2'))
+        return packed.view(np.dtype((np.void, packed.itemsize*combos.shape[1]))).ravel()
+
+    @staticmethod
+    def pack(combos: np.ndarray, counts: np.ndarray) -> dict:
+        """
+        (combos, counts) arrays to {packed key: count}, the layout of ComboCounterDict.pack
+        """
+        return dict(zip(NumpyComboEngine.packed_keys(combos).tolist(), counts.tolist()))
+
+    def count_keys(self, level: int, min_count: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        count_level() as (packed keys, counts) arrays, no dict in between
+        """
+        combos, counts = self.count_ids(level) if min_count is None else self.count_frequent(level, min_count)
+        return self.packed_keys(combos), counts
+
+    def count_level(self, level: int, min_count: int | None = None) -> dict:
+        if min_count is None:
+            return self.pack(*self.count_ids(level))
+
+        return self.pack(*self.count_frequent(level, min_count))
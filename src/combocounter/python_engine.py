@@ -0,0 +1,89 @@
+import itertools
+import struct
+from collections import Counter
+
+import numpy as np
+
+
+class PythonComboEngine:
+    """
+    Pure Python counting engine for ComboCounter (the default)
+    Counts one level at a time over every lineup (rows of player IDs)
+    Keys are packed the same way as ComboCounterDict.pack: ascending IDs, 2 big-endian bytes each
+    """
+
+    def __init__(self, rows: list[tuple[int,...]]):
+
+        # Sorted once, so every combo built from a row is already in canonical order
+        self.rows = [tuple(sorted(row)) for row in rows]
+
+        # Apriori state for count_frequent(), see there
+        self.__frontier = None
+        self.__frequent = None
+
+    @staticmethod
+    def pack_all(counts: Counter, level: int) -> dict:
+        pack = struct.Struct(f'>{level}H').pack
+        return {pack(*combo): count for combo, count in counts.items()}
+
+    def count_level(self, level: int, min_count: int | None = None) -> dict:
+        if min_count is not None:
+            return self.count_frequent(level, min_count)
+
+        # Counting on the ID tuples and packing only the unique ones is cheaper than packing every combo
+        return self.pack_all(
+            Counter(combo for row in self.rows for combo in itertools.combinations(row, level)),
+            level
+        )
+
+    def count_keys(self, level: int, min_count: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        count_level() as (packed keys, counts) arrays, see ComboLevel
+        """
+        counts = self.count_level(level, min_count)
+        return (
+            np.frombuffer(b''.join(counts), dtype=np.dtype((np.void, 2*level))),
+            np.fromiter(counts.values(), dtype=np.int64, count=len(counts))
+        )
+
+    def count_frequent(self, level: int, min_count: int) -> dict:
+        """
+        Apriori version of count_level(), only returns combos appearing in at least min_count lineups
+            - Must be called for every level in order (1, 2, 3, ...)
+            - Each lineup keeps its frequent (k-1)-combos (the "frontier") along with the position of their last player,
+              level k only extends those with the lineup's later players
+            - Candidates with any infrequent (k-1)-subset are dropped before counting
+            - Support is the number of lineups with the combo, which never grows with the level, so pruning is safe
+            - Returned counts are the same as count_level(): a name repeated in a lineup (LOCKED) counts once per slot
+        """
+        if level == 1:
+            counts = Counter((id_,) for row in self.rows for id_ in row)
+            support = Counter((id_,) for row in self.rows for id_ in set(row))
+
+            self.__frequent = {combo for combo, lineups in support.items() if lineups >= min_count}
+            self.__frontier = [
+                [((id_,), position) for position, id_ in enumerate(row) if (id_,) in self.__frequent]
+                for row in self.rows
+            ]
+            return self.pack_all({combo: counts[combo] for combo in self.__frequent}, level)
+
+        counts, support = Counter(), Counter()
+        frontier = []
+        for row, entries in zip(self.rows, self.__frontier):
+            extended = []
+            for prefix, last in entries:
+                for position in range(last+1, len(row)):
+                    combo = prefix + (row[position],)
+
+                    # Prefix (dropping the last player) is frequent by construction
+                    if all(combo[:dropped] + combo[dropped+1:] in self.__frequent for dropped in range(level-1)):
+                        counts[combo] += 1
+                        extended.append((combo, position))
+
+            support.update({combo for combo, _ in extended})
+            frontier.append(extended)
+
+        self.__frequent = {combo for combo, lineups in support.items() if lineups >= min_count}
+        self.__frontier = [[(combo, position) for combo, position in entries if combo in self.__frequent] for entries in frontier]
+
+        return self.pack_all({combo: counts[combo] for combo in self.__frequent}, level)
@@ -0,0 +1,41 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from .engines import ENGINES
+
+def count_shard(engine: str, lineups: list[tuple[str,...]], levels: list[int]) -> dict[int,dict]:
+    """
+    Counts every requested level of a single shard (runs inside a worker process)
+    """
+    engine_ = ENGINES[engine](lineups)
+    return {level: engine_.count_level(level) for level in levels}
+
+def merge_counts(left: dict[int,dict], right: dict[int,dict]) -> dict[int,dict]:
+    """
+    Adds the per-level counts of right into left, always folding the smaller dict into the bigger one
+    """
+    for level, counts in right.items():
+        into, other = (left[level], counts) if len(left[level]) >= len(counts) else (counts, left[level])
+        for key, count in other.items():
+            into[key] = into.get(key, 0) + count
+        left[level] = into
+
+    return left
+
+def count_sharded(engine: str, lineups: list[tuple[str,...]], levels: list[int], workers: int) -> dict[int,dict]:
+    """
+    Splits lineups into one shard per worker, counts the shards in a process pool and tree-reduces the results
+    (pairs of shards are merged each round, so no single dict absorbs every other one)
+    """
+    shard_size = -(-len(lineups) // workers)
+    shards = [lineups[start:start+shard_size] for start in range(0, len(lineups), shard_size)]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(count_shard, [engine]*len(shards), shards, [levels]*len(shards)))
+
+    while len(results) > 1:
+        results = [
+            merge_counts(results[i], results[i+1]) if i+1 < len(results) else results[i]
+            for i in range(0, len(results), 2)
+        ]
+
+    return results[0] if len(results) else {level: dict() for level in levels}
@@ -1,3 +1,5 @@
 from .field import Field
+from .exposure_cube import ExposureCube
+from .field_cache import FieldCache
 
 version='1.0.0'
\ No newline at end of file
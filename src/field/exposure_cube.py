@@ -0,0 +1,69 @@
+import numpy as np
+
+
+class ExposureCube:
+    """
+    Sparse contestant x player exposure counts, CSR-like with plain numpy arrays (contestant and player codes of a Field)
+        - Built in one pass: every (contestant, player) slot of the encoded lineups is keyed and counted with one np.unique
+        - Row view (contestant -> players) and column view (player -> contestants), both sorted by code
+        - A count is the number of the contestant's lineups with the player, as in Field.exposures()
+          (a name in two slots, i.e. LOCKED, counts twice)
+    """
+
+    def __init__(self, entry_codes: np.ndarray, encoded: np.ndarray, n_contestants: int, n_players: int):
+
+        self.n_contestants = n_contestants
+        self.n_players = n_players
+
+        self.entries = np.bincount(entry_codes, minlength=n_contestants)
+
+        keys = (entry_codes.astype(np.int64)[:, None] * n_players + encoded).ravel()
+        keys, counts = np.unique(keys, return_counts=True)
+        rows, columns = np.divmod(keys, n_players)
+
+        # Row view, keys are sorted so every contestant's players are contiguous and sorted
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=n_contestants))])
+        self.indices = columns.astype(np.int32)
+        self.counts = counts.astype(np.int32)
+
+        # Column view, stable so every player's contestants stay sorted
+        order = np.argsort(columns, kind='stable')
+        self.column_indptr = np.concatenate([[0], np.cumsum(np.bincount(columns, minlength=n_players))])
+        self.column_indices = rows[order].astype(np.int32)
+        self.column_counts = self.counts[order]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (
+            self.entries, self.indptr, self.indices, self.counts, self.column_indptr, self.column_indices, self.column_counts
+        ))
+
+    def row(self, contestant: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        (player codes, % of the contestant's entries) for every player the contestant used
+        """
+        start, stop = self.indptr[contestant], self.indptr[contestant+1]
+        return self.indices[start:stop], 100 * self.counts[start:stop] / self.entries[contestant]
+
+    def column(self, player: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        (contestant codes, % of each contestant's entries) for every contestant who used the player
+        """
+        start, stop = self.column_indptr[player], self.column_indptr[player+1]
+        contestants = self.column_indices[start:stop]
+        return contestants, 100 * self.column_counts[start:stop] / self.entries[contestants]
+
+    def pooled(self, contestants: np.ndarray) -> np.ndarray:
+        """
+        % of all the contestants' entries (taken together) with each player, dense over every player code
+        """
+        slices = [slice(self.indptr[contestant], self.indptr[contestant+1]) for contestant in contestants]
+        if not len(slices):
+            return np.zeros(self.n_players)
+
+        counts = np.bincount(
+            np.concatenate([self.indices[slice_] for slice_ in slices]),
+            weights=np.concatenate([self.counts[slice_] for slice_ in slices]),
+            minlength=self.n_players
+        )
+        return 100 * counts / self.entries[contestants].sum()
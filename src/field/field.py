@@ -1,5 +1,19 @@
+import functools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import Executor, Future
+
+import numpy as np
 import pandas as pd
 
+from combocounter import ComboCounter
+from .exposure_cube import ExposureCube
+from .lineup_tokenizer import LineupTokenizer
 
 def flatten(nested_seq):
         """
@@ -16,81 +30,294 @@ def flatten(nested_seq):
         return [element for inner_seq in nested_seq for element in inner_seq]
         # return list(itertools.chain.from_iterable(nested_seq))
 
+def memoized(method):
+    """
+    Analyses without arguments are computed once per Field, every later call gets the same result
+        - Stored as futures, so a call made while another thread (see Field.precompute) is computing it just waits
+        - Calls with kwargs are computed every time
+    The result is shared, callers must not modify it
+    """
+    @functools.wraps(method)
+    def wrapper(self, **kwargs):
+        if kwargs:
+            return method(self, **kwargs)
+
+        with Field.RESULTS_LOCK:
+            results = self.__dict__.setdefault('results', {})
+            future = results.get(method.__name__)
+            compute = future is None
+            if compute:
+                future = results[method.__name__] = Future()
+
+        if compute:
+            try:
+                future.set_result(method(self))
+            except Exception as e:
+                # Not kept, the next call tries again
+                with Field.RESULTS_LOCK:
+                    results.pop(method.__name__, None)
+                future.set_exception(e)
+
+        return future.result()
+
+    return wrapper
+
 class Field:
 
+    # Analyses precompute() starts in the background
+    PRECOMPUTED = ('ownership', 'max_entries', 'exposure_cube', 'mme_ownership', 'duplicates')
+    RESULTS_LOCK = threading.Lock()
+
+    # Columns of the standings (one row per entry) and of the player / ownership block next to them
+    STANDINGS_COLUMNS = ['Rank', 'EntryName', 'Points', 'Lineup']
+    PERFORMANCE_COLUMNS = ['Player', '%Drafted', 'FPTS']
+
     def __init__(self, file_buffer, **kwargs):
+        """
+        chunksize: stream the file in chunks of that many rows instead of reading it whole, see ingest()
+        """
 
         self.sport = kwargs.get('sport', 'PGA').upper()
         self.mode = kwargs.get('mode', 'classic').lower()
 
+        if kwargs.get('chunksize'):
+            self.ingest(file_buffer, kwargs['chunksize'])
+            return
+
         self.raw = (pd
                     .read_csv(file_buffer, dtype='str')
                     .drop(['Unnamed: 6', 'Roster Position'], axis=1)
                    )
 
-        if 'UTIL' in self.raw['Lineup'].iloc[0] and self.sport == 'PGA':
+        self.detect_sport(self.raw['Lineup'].iloc[0])
+
+    def detect_sport(self, lineup_str: str) -> None:
+        """
+        Sport defaults to PGA, NBA / NFL files are recognized from their lineups
+        """
+        if 'UTIL' in lineup_str and self.sport == 'PGA':
             self.sport='NBA'
 
+        if 'FLEX' in lineup_str and self.sport == 'PGA':
+            self.sport='NFL'
+
+        self.tokenizer = LineupTokenizer(self.sport, self.mode)
+
+    @staticmethod
+    def performances_from(frame: pd.DataFrame) -> pd.DataFrame:
+        """
+        Player / ownership block of the standings -> index = name, columns = own, fpts
+        """
+        return (frame
+                [Field.PERFORMANCE_COLUMNS]
+                .set_axis(['name', 'own', 'fpts'], axis=1)
+                .dropna()
+                .assign(
+                    own=lambda df_: df_.own.map(lambda ownstr: float(ownstr.replace('%', ''))),
+                    fpts=lambda df_: df_.fpts.astype('float')
+                )
+                .set_index('name')
+               )
+
+    @staticmethod
+    def standings_from(frame: pd.DataFrame) -> pd.DataFrame:
+        """
+        Entries of the standings -> columns = rank, entry, fpts, lineup (still the DK string)
+        """
+        return (frame
+                [Field.STANDINGS_COLUMNS]
+                .set_axis(['rank', 'entry', 'fpts', 'lineup'], axis=1)
+                .dropna()
+                .assign(
+                    # Remove the brackets showing which entry of persons
+                    entry=lambda df_: df_.entry.map(lambda entry_str: entry_str.split(' ')[0]),
+                )
+               )
+
     @staticmethod
-    def convert_to_lineup_PGA(lineup_str: str) -> tuple[str,str,str,str,str,str]:
+    def sorted_dictionary(values: np.ndarray, codes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
         """
-        Removes the positions (' G ') from the provided string and then creates lineup with all positions removed.
+        Dictionary values with codes into it -> the same with the dictionary sorted (and int32 codes)
         """
-        parts = [part for part in lineup_str.split('G ') if len(part)]
-        return tuple([part.strip() for part in parts])
+        order = np.argsort(values)
+        remap = np.empty(len(order), dtype=np.int32)
+        remap[order] = np.arange(len(order), dtype=np.int32)
 
+        return np.asarray(values, dtype=object)[order], remap[codes]
 
     @staticmethod
-    def convert_to_lineup_NBA(lineup_str: str) -> tuple[str,str,str,str,str,str]:
+    def fold(ids: dict, values) -> np.ndarray:
         """
-        Removes the positions pos from the provided string and then creates lineup with all positions removed.
-        EXAMPLE: C Alexandre Sarr F Paolo Banchero G Ryan Rollins PF Evan Mobley PG Cole Anthony SF Kyle Kuzma SG Donovan Mitchell UTIL Orlando Robinson
-            - Since C always comes first (need to confirm), that will be special case after everything else.
-            - Don't want to mess up data integrity accidently
-            - Only way this causes issues if there is part of a name ending in uppercase --> "C" (for example, doing it this way if it had been "G" instead would cause issues with "OG Anunoby")
+        Codes of values in ids, new values get the next code
+        Only the unique values of a chunk go through Python
+        """
+        local, uniques = pd.factorize(values)
+        return np.array([ids.setdefault(value, len(ids)) for value in uniques], dtype=np.int32)[local]
+
+    def ingest(self, file_buffer, chunksize: int) -> None:
         """
+        Streaming version of reading the CSV and clean_data(), for the biggest standings exports
+            - Only the used columns are read, chunksize rows at a time
+            - Each chunk's lineups and entry names are tokenized and folded into the encoded representation
+              right away, the chunk itself is then dropped
+            - The player / ownership block is pulled out of each chunk on the side
+        Peak memory is one chunk plus the encoded result, the Field comes out already cleaned
+        """
+        player_ids, entry_ids = {}, {}
+        encoded, entry_codes, ranks, fpts, performances = [], [], [], [], []
+
+        for chunk in pd.read_csv(file_buffer, dtype='str', usecols=self.STANDINGS_COLUMNS + self.PERFORMANCE_COLUMNS, chunksize=chunksize):
+            standings = self.standings_from(chunk)
 
-        for pos_str in ['PG', 'SG', 'SF', 'PF', 'C', 'G', 'F', 'UTIL']:
-            chars_with_padding = f' {pos_str} ' if pos_str != 'C' else 'C '
-            lineup_str = lineup_str.replace(chars_with_padding, '_')
+            if not hasattr(self, 'tokenizer'):
+                self.detect_sport(chunk['Lineup'].iloc[0])
+
+            names = self.tokenizer.tokenize(standings['lineup'])
+
+            encoded.append(self.fold(player_ids, names.ravel()).reshape(names.shape))
+            entry_codes.append(self.fold(entry_ids, standings['entry'].to_numpy()))
+            ranks.append(standings['rank'].to_numpy(dtype='int32'))
+            fpts.append(standings['fpts'].to_numpy(dtype='float'))
+            performances.append(self.performances_from(chunk))
+
+        # Chunks past the player block contribute empty (object) frames
+        self.performances = pd.concat(performances).astype('float')
+
+        self.players, self.encoded = self.sorted_dictionary(np.array(list(player_ids), dtype=object), np.concatenate(encoded))
+        self.ordered = self.order_lineups(self.encoded)
+
+        entries, entry_codes = self.sorted_dictionary(np.array(list(entry_ids), dtype=object), np.concatenate(entry_codes))
+        self.clean = pd.DataFrame({
+            'rank': np.concatenate(ranks),
+            'entry': pd.Categorical.from_codes(entry_codes, categories=entries),
+            'fpts': np.concatenate(fpts)
+        })
+
+    @classmethod
+    def from_snapshot(cls, directory: str, mmap_mode: str | None = 'r') -> 'Field':
+        """
+        Loads a cleaned Field written by save_snapshot(), no CSV parsing and no clean_data()
+            - The integer arrays are memory-mapped (mmap_mode='r') so a load costs milliseconds
+            - Names (players, contestants, performances) are small and loaded into memory
+        """
+        with open(os.path.join(directory, 'snapshot.json'), 'r') as f:
+            metadata = json.load(f)
+
+        def load(name, **kwargs):
+            return np.load(os.path.join(directory, f'{name}.npy'), **kwargs)
+
+        field = cls.__new__(cls)
+        field.sport = metadata['sport']
+        field.mode = metadata['mode']
+        field.tokenizer = LineupTokenizer(field.sport, field.mode)
+
+        field.players = load('players').astype(object)
+        field.encoded = load('encoded', mmap_mode=mmap_mode)
+        field.ordered = load('ordered', mmap_mode=mmap_mode)
+
+        field.performances = pd.DataFrame(
+            {'own': load('performance_own'), 'fpts': load('performance_fpts')},
+            index=pd.Index(load('performance_names').astype(object), name='name')
+        )
+        field.clean = pd.DataFrame({
+            'rank': load('rank', mmap_mode=mmap_mode),
+            'entry': pd.Categorical.from_codes(load('entry_codes', mmap_mode=mmap_mode), categories=load('entries').astype(object)),
+            'fpts': load('fpts', mmap_mode=mmap_mode)
+        })
+
+        return field
+
+    def save_snapshot(self, directory: str) -> None:
+        """
+        Writes the cleaned field (performances, encoded lineups, entries) as .npy files plus a small snapshot.json
+        Everything is fixed-width so from_snapshot() can memory-map it, names are stored as unicode arrays
+            - Written to a temporary directory that is renamed into place, readers never see half a snapshot
+            - A complete snapshot already there (e.g. saved by a concurrent request) is kept as is
+        """
+        if os.path.exists(os.path.join(directory, 'snapshot.json')):
+            return
 
-        parts = [part for part in lineup_str.split('_') if len(part)]
-        return tuple([part.strip() for part in parts])
+        if not hasattr(self, 'clean'):
+            self.clean_data()
 
-    def convert_to_lineup(self, lineup_str: str) -> tuple[str,str,str,str,str,str]:
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        tmp_directory = tempfile.mkdtemp(dir=parent, prefix=f'{os.path.basename(directory)}.', suffix='.tmp')
+
+        try:
+            arrays = {
+                'players': self.players.astype(str),
+                'encoded': self.encoded,
+                'ordered': self.ordered,
+                'rank': self.clean['rank'].to_numpy(),
+                'entry_codes': self.clean['entry'].cat.codes.to_numpy(),
+                'entries': self.clean['entry'].cat.categories.to_numpy().astype(str),
+                'fpts': self.clean['fpts'].to_numpy(),
+                'performance_names': self.performances.index.to_numpy().astype(str),
+                'performance_own': self.performances['own'].to_numpy(),
+                'performance_fpts': self.performances['fpts'].to_numpy()
+            }
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_directory, f'{name}.npy'), np.ascontiguousarray(array))
+
+            with open(os.path.join(tmp_directory, 'snapshot.json'), 'w') as f:
+                json.dump({'sport': self.sport, 'mode': self.mode, 'n_entries': len(self.clean)}, f)
+
+            # Leftover of an interrupted save (no snapshot.json), os.replace can not swap out a non-empty directory
+            if os.path.isdir(directory) and not os.path.exists(os.path.join(directory, 'snapshot.json')):
+                shutil.rmtree(directory, ignore_errors=True)
+
+            try:
+                os.replace(tmp_directory, directory)
+            except OSError:
+                # Another request published the same snapshot first
+                if not os.path.exists(os.path.join(directory, 'snapshot.json')):
+                    raise
+        finally:
+            shutil.rmtree(tmp_directory, ignore_errors=True)
+
+    def convert_to_lineup(self, lineup_str: str) -> tuple[str,...]:
         """
-        Removes the positions (' G ') from the provided string and then creates lineup with all positions removed.
+        Removes the positions from the provided string and then creates lineup with all positions removed.
+        EXAMPLE: C Alexandre Sarr F Paolo Banchero G Ryan Rollins PF Evan Mobley PG Cole Anthony SF Kyle Kuzma SG Donovan Mitchell UTIL Orlando Robinson
+        Whole columns go through self.tokenizer.tokenize() instead, this is for one-off strings
         """
-        return {'NBA': self.convert_to_lineup_NBA, 'PGA': self.convert_to_lineup_PGA}[self.sport](lineup_str)
+        return self.tokenizer.tokenize_one(lineup_str)
 
     @staticmethod
     def exposures(lineups: tuple[tuple[str,...], ...], **kwargs) -> pd.Series:
         """
         Returns the exposure of players in multiple lineups
+        Counted in a single pass over the flattened lineups
+        Without values=True the exposures get plotted, see plot_exposures()
         """
 
         n_lineups = len(lineups)
-        flattened = flatten(lineups)
-        n_players = len(set(flattened))
+        counts = Counter(flatten(lineups))
 
-        # level = kwargs.get('level', 1)
+        # Exposures as percentages
+        exposure = pd.Series(
+            {name_: 100 * count_ / n_lineups for name_, count_ in counts.items() if name_.strip() != 'LOCKED'},
+            dtype='float'
+        )
 
-        # Raw numbers
-        # counts = {name_: flattened.count(name_) for name_ in set(flattened)}
+        if kwargs.get('values', False):
+            return exposure.sort_values(ascending=False)
 
-        # Exposures as percentages
-        exposure = {name_: 100 * flattened.count(name_) / n_lineups for name_ in set(flattened) if name_.strip() != 'LOCKED'}
+        return Field.plot_exposures(exposure, n_lineups=n_lineups, n_players=len(counts), **kwargs)
+
+    @staticmethod
+    def plot_exposures(exposure: pd.Series, **kwargs):
+        """
+        Horizontal bar chart of exposures (only place matplotlib gets pulled in)
+        """
         contestant = kwargs.get('contestant')
 
         title = 'Exposures'
         if contestant is not None:
-            title += f" for {contestant}'s {n_lineups} entries, (N = {n_players}):"
+            title += f" for {contestant}'s {kwargs.get('n_lineups')} entries, (N = {kwargs.get('n_players')}):"
 
-        if kwargs.get('values', False):
-            return pd.Series(exposure).sort_values(ascending=False)
-
-        return (pd
-                .Series(exposure)
+        return (exposure
                 .sort_values()
                 .plot
                 .barh(
@@ -105,6 +332,15 @@ class Field:
         """
         return tuple(sorted(lineup_tup)) if self.mode == 'classic' else (lineup_tup[0],) + tuple(sorted(lineup_tup[1:]))
 
+    def order_lineups(self, names: np.ndarray) -> np.ndarray:
+        """
+        Vectorized order_lineup() over an (n_lineups, n_slots) array of names (or of player codes, see clean_data)
+        """
+        if self.mode == 'classic':
+            return np.sort(names, axis=1)
+
+        return np.hstack([names[:, :1], np.sort(names[:, 1:], axis=1)])
+
     def clean_data(self, **kwargs) -> None:
         """
         Cleans the raw DraftKings provided file into customized format.
@@ -117,34 +353,146 @@ class Field:
         print("Entering clean_data...")
         print(f"DataFrame columns: {self.raw.columns.tolist()}")
 
-        self.performances = (self.raw
-                             .copy(deep=True)
-                             [['Player', '%Drafted', 'FPTS']]
-                             .set_axis(['name', 'own', 'fpts'], axis=1)
-                             .dropna()
-                             .assign(
-                                 own=lambda df_: df_.own.map(lambda ownstr: float(ownstr.replace('%', ''))),
-                                 fpts=lambda df_: df_.fpts.astype('float')
-                             )
-                             .set_index('name')
-                            )
-
-        self.clean = (self.raw
-                      .copy(deep=True)
-                      [['Rank', 'EntryName', 'Points', 'Lineup']]
-                      .set_axis(['rank', 'entry', 'fpts', 'lineup'], axis=1)
-                      .dropna()
+        self.performances = self.performances_from(self.raw)
+        self.clean = self.standings_from(self.raw)
+
+        # Whole Lineup column parsed in one pass into a fixed-width array of names
+        names = self.tokenizer.tokenize(self.clean['lineup'])
+
+        # Columnar encoding, every analysis runs on these arrays instead of tuples of names
+        #   - players: sorted player dictionary, so ordering codes is the same as ordering names
+        #   - encoded: entries x slots int32 matrix of player codes, in DK's position order
+        #   - ordered: same matrix with every lineup ordered (order_lineup), no longer ordered by position
+        #   - clean['entry'] is categorical, its codes are the contestant codes
+        codes, players = pd.factorize(names.ravel())
+        self.players, codes = self.sorted_dictionary(players, codes)
+
+        self.encoded = codes.reshape(names.shape)
+        self.ordered = self.order_lineups(self.encoded)
+
+        self.clean = (self.clean
+                      .drop(columns='lineup')
                       .assign(
-                          lineup=lambda df_: df_.lineup.map(lambda lineup_str_: self.convert_to_lineup(lineup_str_)),
-                          # Remove the brackets showing which entry of persons
-                          entry=lambda df_: df_.entry.map(lambda entry_str: entry_str.split(' ')[0]),
-                          # Ordered lineup, no longer ordered by position
-                          ordered=lambda df_: df_.lineup.map(lambda lineup_: self.order_lineup(lineup_))
+                          rank=lambda df_: df_['rank'].astype('int32'),
+                          entry=lambda df_: df_.entry.astype('category'),
+                          fpts=lambda df_: df_.fpts.astype('float')
                       )
                      )
 
+        # Everything is in performances / clean / the encoded arrays now, the raw strings are by far the biggest part
+        del self.raw
+
         return
 
+    @property
+    def nbytes(self) -> int:
+        """
+        Estimated memory held by the field, used for FieldCache's byte budget
+        Memory-mapped arrays are counted as well, they end up in memory once read
+        Finished memoized results (exposure cube, lineup groups, duplicates, ...) count too
+        """
+        frames = [getattr(self, name) for name in ('raw', 'performances', 'clean') if hasattr(self, name)]
+        arrays = [getattr(self, name) for name in ('encoded', 'ordered') if hasattr(self, name)]
+
+        with Field.RESULTS_LOCK:
+            futures = list(self.__dict__.get('results', {}).values())
+        results = [future.result() for future in futures if future.done() and future.exception() is None]
+
+        return int(
+            sum(frame.memory_usage(deep=True).sum() for frame in frames)
+            + sum(array.nbytes for array in arrays)
+            + sum(len(name) for name in getattr(self, 'players', ()))
+            + sum(self.sizeof(result) for result in results)
+        )
+
+    @staticmethod
+    def sizeof(value) -> int:
+        """
+        Rough size in bytes of an analysis result: frames, arrays (or anything with nbytes) and containers of those
+        """
+        if isinstance(value, pd.DataFrame):
+            return int(value.memory_usage(deep=True).sum())
+        if isinstance(value, pd.Series):
+            return int(value.memory_usage(deep=True))
+        if hasattr(value, 'nbytes'):
+            return int(value.nbytes)
+        if isinstance(value, dict):
+            return sys.getsizeof(value) + sum(Field.sizeof(key) + Field.sizeof(item) for key, item in value.items())
+        if isinstance(value, (list, tuple, set)):
+            return sys.getsizeof(value) + sum(Field.sizeof(item) for item in value)
+
+        return sys.getsizeof(value)
+
+    def decode(self, codes: np.ndarray) -> tuple[tuple[str,...], ...]:
+        """
+        Rows of player codes (e.g. self.ordered[mask]) back to tuples of names
+        """
+        return tuple(map(tuple, self.players[codes].tolist()))
+
+    @memoized
+    def exposure_cube(self) -> ExposureCube:
+        """
+        Contestant x player exposures of the whole field, built once, see ExposureCube
+        """
+        if not hasattr(self, 'clean'):
+            self.clean_data()
+
+        entry = self.clean['entry']
+        return ExposureCube(entry.cat.codes.to_numpy(), self.encoded, len(entry.cat.categories), len(self.players))
+
+    def exposure_series(self, players: np.ndarray, exposures: np.ndarray) -> pd.Series:
+        """
+        Player codes + exposures -> exposures(values=True) style Series (names, LOCKED and 0% left out, descending)
+        """
+        keep = (exposures > 0) & (pd.Index(self.players[players]).str.strip() != 'LOCKED')
+
+        return (pd
+                .Series(exposures[keep], index=self.players[players[keep]])
+                .sort_values(ascending=False)
+               )
+
+    def contestant_exposures(self, contestant: str) -> pd.Series | None:
+        """
+        Exposures of one contestant, a row of the exposure cube
+        """
+        categories = self.clean['entry'].cat.categories
+        if contestant not in categories:
+            return None
+
+        return self.exposure_series(*self.exposure_cube().row(categories.get_loc(contestant)))
+
+    def heaviest_on(self, player: str, top_n: int = 25) -> pd.Series:
+        """
+        Contestants with the highest exposure to player, a column of the exposure cube
+        Index = contestant, values = % of the contestant's entries with the player
+        """
+        if not hasattr(self, 'clean'):
+            self.clean_data()
+
+        code = np.searchsorted(self.players, player)
+        if code == len(self.players) or self.players[code] != player:
+            return pd.Series(dtype='float', name='exposure')
+
+        contestants, exposures = self.exposure_cube().column(code)
+        top = np.argsort(-exposures, kind='stable')[:top_n]
+
+        return pd.Series(
+            exposures[top],
+            index=pd.Index(self.clean['entry'].cat.categories[contestants[top]], name='contestant'),
+            name='exposure'
+        )
+
+    def precompute(self, executor: Executor) -> list[Future]:
+        """
+        Starts every analysis in PRECOMPUTED on executor, the methods then return (or wait for) those results
+        Returns the submitted futures, e.g. to re-measure nbytes once they are all done
+        """
+        if not hasattr(self, 'clean'):
+            self.clean_data()
+
+        return [executor.submit(getattr(self, name)) for name in self.PRECOMPUTED]
+
+    @memoized
     def ownership(self, **kwargs):
 
         if not hasattr(self, 'clean'):
@@ -157,34 +505,17 @@ class Field:
             self.clean_data()
 
         # contestant = kwargs.get('contestant', 'jdeegs99')
-        entries = tuple(self.clean.loc[self.clean['entry'] == contestant, 'ordered'])
+        exposures = self.contestant_exposures(contestant)
 
-        if not len(entries):
+        if exposures is None:
             print(f'{contestant} did not compete in this contest.')
             return
 
-        exposures = (pd
-                     .DataFrame(self.exposures(entries, values=True))
-                     .set_axis(['own'], axis=1)
-                    )
-
-        # if 'LOCKED' in exposures:
-        #     self.performances.loc['LOCKED','own'] = 0.0
-
-        for name in set(self.performances.index).difference(set(exposures.index)):
-            exposures.loc[name, 'own'] = 0.0
-
-        ownership = (self.performances
-                        # .reset_index()
-                    #  [['name', 'own']]
-                    [['own']]
-                    #  .set_index('name')
-                    )
-
-        # if kwargs.get('values', True):
+        # Players nobody in the entries used are 0% exposure, one aligned subtraction against ownership
         return (exposures
-                .sub(ownership)
-                .rename({'own': 'leverage'}, axis=1)
+                .reindex(exposures.index.union(self.performances.index), fill_value=0.0)
+                .sub(self.performances['own'])
+                .to_frame('leverage')
                 .sort_values('leverage', ascending=False)
                 )
 
@@ -199,51 +530,197 @@ class Field:
         #         )
         #        )
 
-    def max_entries(self) -> dict[str,int]:
+    def leverage_matrix(self, contestants=None) -> pd.DataFrame:
+        """
+        leverage() for many contestants in one call
+            - contestants defaults to the max entrants
+            - index = contestant, columns = player, values = contestant's exposure - field ownership
+        """
         if not hasattr(self, 'clean'):
             self.clean_data()
 
-         # Count entries per contestant
-        entry_counts = self.clean['entry'].value_counts()
+        if contestants is None:
+            contestants = list(self.max_entries())
 
-        # Find the maximum count
-        max_count = entry_counts.max()
+        entry = self.clean['entry']
+        selected = pd.Index(dict.fromkeys(contestant for contestant in contestants if contestant in entry.cat.categories))
 
-        # # Filter for contestants with max count
-        # max_entries = {}
-        # for contestant, count in entry_counts.items():
-        #     if count == max_count:
-        #         # Explicitly convert to str and int
-        #         max_entries[str(contestant)] = int(count)
+        # Contestant x player counts in one bincount over (selected contestant, player code) pairs
+        owner = selected.get_indexer(entry.cat.categories)[entry.cat.codes.to_numpy()]
+        keep = owner >= 0
+        n_players = len(self.players)
 
-        # return max_entries
+        counts = np.bincount(
+            (owner[keep, None] * n_players + self.encoded[keep]).ravel(),
+            minlength=len(selected) * n_players
+        ).reshape(len(selected), n_players)
+
+        used = counts.any(axis=0) & (pd.Index(self.players).str.strip() != 'LOCKED')
+
+        # As % of each contestant's entries
+        exposures = pd.DataFrame(
+            100 * counts[:, used] / np.bincount(owner[keep], minlength=len(selected))[:, None],
+            index=selected,
+            columns=self.players[used]
+        )
+
+        return (exposures
+                .reindex(columns=exposures.columns.union(self.performances.index), fill_value=0.0)
+                .sub(self.performances['own'], axis=1)
+                .rename_axis(index='contestant', columns='name')
+               )
+
+    @memoized
+    def max_entries(self) -> dict[str,int]:
+        if not hasattr(self, 'clean'):
+            self.clean_data()
+
+        # Count entries per contestant
+        entry = self.clean['entry']
+        entry_counts = np.bincount(entry.cat.codes.to_numpy(), minlength=len(entry.cat.categories))
 
         return {
-            entry: count
-            for entry, count in entry_counts.items()
-            if count == max_count
+            entry.cat.categories[code]: int(entry_counts[code])
+            for code in np.flatnonzero(entry_counts == entry_counts.max())
         }
 
+    @memoized
+    def lineup_groups(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Groups identical (ordered) lineups with a 64-bit fingerprint per row, one np.unique over uint64
+            - Fingerprint: FNV-1a style over the row's player codes, with a final avalanche
+            - Every group is checked against its first row, on a collision it falls back to the raw row bytes
+        Returns (first, inverse, counts): first row of each group, group of each row, size of each group
+        """
+        if not hasattr(self, 'clean'):
+            self.clean_data()
+
+        ordered = np.ascontiguousarray(self.ordered)
+
+        fingerprints = np.full(len(ordered), 0xcbf29ce484222325, dtype=np.uint64)
+        for column in ordered.T.astype(np.uint64):
+            fingerprints = (fingerprints ^ column) * np.uint64(0x100000001b3)
+
+        fingerprints ^= fingerprints >> np.uint64(33)
+        fingerprints *= np.uint64(0xff51afd7ed558ccd)
+        fingerprints ^= fingerprints >> np.uint64(33)
+
+        _, first, inverse, counts = np.unique(fingerprints, return_index=True, return_inverse=True, return_counts=True)
+
+        if not (ordered == ordered[first[inverse]]).all():
+            print('Lineup fingerprint collision, grouping on the full rows')
+            keys = ordered.view(np.dtype((np.void, ordered.itemsize * ordered.shape[1]))).ravel()
+            _, first, inverse, counts = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+
+        return first, inverse.ravel(), counts
+
+    @memoized
     def duplicates(self, **kwargs):
         """
-        Returns all lineups that were duped more than 5x (for now)
+        Returns all lineups entered at least min_dupes times (default 6, i.e. duped more than 5x)
+            - top_k: only the top_k most duped
+        Index = ordered lineup, column = count
         """
         if not hasattr(self, 'clean'):
             self.clean_data()
 
-        dupes = (self.clean
-                 .groupby('ordered')
-                 ['lineup']
-                 .agg(['count'])
-                 .pipe(lambda df_: df_.loc[df_['count'] > 5])
-                 .sort_values('count', ascending=False)
-                )
+        first, _, counts = self.lineup_groups()
+
+        duped = np.flatnonzero(counts >= kwargs.get('min_dupes', 6))
+        duped = duped[np.argsort(-counts[duped], kind='stable')][:kwargs.get('top_k')]
+
+        dupes = pd.DataFrame(
+            {'count': counts[duped]},
+            index=pd.Index(self.decode(self.ordered[first[duped]]), name='ordered', tupleize_cols=False)
+        )
 
         return dupes
 
+    def contestant_duplicates(self, contestant: str, min_dupes: int = 2) -> pd.DataFrame:
+        """
+        Which of contestant's lineups were entered at least min_dupes times across the whole field
+        Index = ordered lineup, columns = entries (contestant's own), count (whole field)
+        """
+        if not hasattr(self, 'clean'):
+            self.clean_data()
+
+        first, inverse, counts = self.lineup_groups()
+
+        groups, entries = np.unique(inverse[(self.clean['entry'] == contestant).to_numpy()], return_counts=True)
+        duped = counts[groups] >= min_dupes
+        groups, entries = groups[duped], entries[duped]
+
+        return (pd
+                .DataFrame(
+                    {'entries': entries, 'count': counts[groups]},
+                    index=pd.Index(self.decode(self.ordered[first[groups]]), name='ordered', tupleize_cols=False)
+                )
+                .sort_values('count', ascending=False)
+               )
 
+    @memoized
     def mme_ownership(self):
         if not hasattr(self, 'clean'):
             self.clean_data()
 
-        return self.exposures(tuple(self.clean.loc[self.clean['entry'].isin(self.max_entries()), 'ordered']), values=True)
\ No newline at end of file
+        # Max entrants' entries taken together, pooled from their rows of the exposure cube
+        contestants = self.clean['entry'].cat.categories.get_indexer(list(self.max_entries()))
+
+        return self.exposure_series(np.arange(len(self.players)), self.exposure_cube().pooled(contestants))
+
+    def combos(self, level: int = 2, top_n: int = 25, **kwargs) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Most common combos (stacks) of level players across the entire field, and every contestant's over/under on them
+            - Candidates come from the numpy engine in approximate mode (at most capacity combos held), so memory
+              stays fixed no matter how many entries the contest has
+            - The returned counts are then exact, from one vectorized membership pass per combo
+            - Combos with LOCKED are left out
+        Returns:
+            top: index = combo, columns = count, pct (% of all entries)
+            over_under: index = contestant, columns = combo, values = contestant's % of entries with the combo - field %
+        """
+        if not hasattr(self, 'clean'):
+            self.clean_data()
+
+        # Counted on player codes, names only come back for the candidates (labels)
+        cc = ComboCounter(
+            list(map(tuple, self.ordered.tolist())),
+            k=level,
+            engine='numpy',
+            capacity=kwargs.get('capacity', 20_000),
+            chunk_size=kwargs.get('chunk_size', 5_000),
+            labels=dict(enumerate(self.players.tolist()))
+        )
+        candidates = cc.top(level, top_n, exclude=('LOCKED',))
+
+        rows = self.encoded
+        entry_codes = self.clean['entry'].cat.codes.to_numpy()
+        contestants = self.clean['entry'].cat.categories
+        entries_per_contestant = np.bincount(entry_codes, minlength=len(contestants))
+
+        counts, contestant_pct = {}, {}
+        for combo in candidates:
+            combo = (combo,) if isinstance(combo, str) else combo
+
+            has_combo = np.ones(len(rows), dtype=bool)
+            for name in combo:
+                has_combo &= (rows == np.searchsorted(self.players, name)).any(axis=1)
+
+            counts[combo] = int(has_combo.sum())
+            contestant_pct[combo] = 100 * np.bincount(entry_codes, weights=has_combo) / entries_per_contestant
+
+        top = (pd
+               .DataFrame({'count': np.array(list(counts.values()), dtype=np.int64)}, index=pd.Index(list(counts), tupleize_cols=False))
+               .assign(pct=lambda df_: 100 * df_['count'] / len(rows))
+               .sort_values('count', ascending=False)
+              )
+
+        # No candidates (top_n=0, level above the roster size, only LOCKED combos) -> empty frames, not a column_stack error
+        over_under = pd.DataFrame(
+            np.column_stack([contestant_pct[combo] - top.loc[[combo], 'pct'].iloc[0] for combo in top.index])
+            if len(top) else np.empty((len(contestants), 0)),
+            index=contestants,
+            columns=top.index
+        )
+
+        return top, over_under
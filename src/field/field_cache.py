@@ -0,0 +1,120 @@
+import threading
+from collections import OrderedDict
+
+from .field import Field
+
+
+class FieldCache:
+    """
+    In-process LRU cache of ready (cleaned) Field objects
+        - Bounded by an estimated byte budget (Field.nbytes) rather than a number of entries
+        - A field is measured when it is put and again on resize(), results it computes in between are not counted
+        - Least recently used fields are evicted until the budget fits, a field bigger than the whole budget is not held
+        - hits / misses / evictions counters, see stats()
+    One instance per worker process, safe to share between the worker's threads
+    """
+
+    def __init__(self, max_bytes: int):
+
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.__fields = OrderedDict()
+        self.__sizes = {}
+        self.__lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.__fields)
+
+    def __contains__(self, key) -> bool:
+        return key in self.__fields
+
+    def get(self, key) -> Field | None:
+        with self.__lock:
+            if key not in self.__fields:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.__fields.move_to_end(key)
+            return self.__fields[key]
+
+    def put(self, key, field: Field) -> None:
+        size = field.nbytes
+
+        with self.__lock:
+            self.__discard(key)
+
+            if size > self.max_bytes:
+                print(f'Field of {size} bytes is over the cache budget ({self.max_bytes}), not cached')
+                return
+
+            while self.nbytes + size > self.max_bytes:
+                oldest = next(iter(self.__fields))
+                self.__discard(oldest)
+                self.evictions += 1
+
+            self.__fields[key] = field
+            self.__sizes[key] = size
+            self.nbytes += size
+
+    def resize(self, key) -> None:
+        """
+        Re-measures a held field (e.g. once its precomputed results are in) and evicts others if it grew
+        """
+        with self.__lock:
+            field = self.__fields.get(key)
+        if field is None:
+            return
+
+        size = field.nbytes
+
+        with self.__lock:
+            # Replaced or evicted while it was being measured
+            if self.__fields.get(key) is not field:
+                return
+
+            self.nbytes += size - self.__sizes[key]
+            self.__sizes[key] = size
+
+            if size > self.max_bytes:
+                print(f'Field of {size} bytes is over the cache budget ({self.max_bytes}), dropped')
+                self.__discard(key)
+                return
+
+            while self.nbytes > self.max_bytes:
+                oldest = next(key_ for key_ in self.__fields if key_ != key)
+                self.__discard(oldest)
+                self.evictions += 1
+
+    def keys(self) -> list:
+        with self.__lock:
+            return list(self.__fields)
+
+    def pop(self, key) -> Field | None:
+        """
+        Drops key (e.g. its files expired), returns the field if it was held
+        """
+        with self.__lock:
+            field = self.__fields.get(key)
+            self.__discard(key)
+            return field
+
+    def __discard(self, key) -> None:
+        if key in self.__fields:
+            del self.__fields[key]
+            self.nbytes -= self.__sizes.pop(key)
+
+    def stats(self) -> dict:
+        return {
+            'fields': len(self.__fields),
+            'bytes': self.nbytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
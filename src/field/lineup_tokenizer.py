@@ -0,0 +1,61 @@
+import re
+
+import numpy as np
+
+from __info import PLAYER_COLUMNS
+
+
+class LineupTokenizer:
+    """
+    Table-driven parser for the Lineup column of DraftKings contest standings
+    EXAMPLE: C Alexandre Sarr F Paolo Banchero G Ryan Rollins PF Evan Mobley PG Cole Anthony SF Kyle Kuzma SG Donovan Mitchell UTIL Orlando Robinson
+        - DK writes the roster slots sorted by position, so the slot sequence for a sport/mode is known up front
+          (built from PLAYER_COLUMNS, numbered slots like UTIL1 or G3 collapse to their position)
+        - One anchored regex per sport/mode: a name can contain a position token (OG Anunoby) without breaking the split
+        - Whole column is parsed in a single findall over the joined strings
+    """
+
+    def __init__(self, sport: str, mode: str):
+
+        self.sport = sport.upper()
+        self.mode = mode.lower()
+
+        self.positions = sorted(re.sub(r'\d+$', '', column) for column in PLAYER_COLUMNS[self.sport][self.mode])
+        self.width = len(self.positions)
+
+        self.pattern = re.compile(
+            '^' + ' '.join(f'{re.escape(position)} ([^\n]+?)' for position in self.positions) + '$',
+            re.MULTILINE
+        )
+
+        # Fallback for a lineup that does not follow the sorted slot order
+        self.position_token = re.compile(
+            r'(?:^|\s)(?:' + '|'.join(re.escape(position) for position in sorted(set(self.positions), key=len, reverse=True)) + r')\s'
+        )
+
+    def tokenize_one(self, lineup_str: str) -> tuple[str,...]:
+        """
+        Single lineup string -> tuple of names in slot order
+        """
+        match = self.pattern.fullmatch(lineup_str)
+        if match is not None:
+            return match.groups()
+
+        parts = tuple(part.strip() for part in self.position_token.split(lineup_str) if len(part.strip()))
+        if len(parts) != self.width:
+            raise ValueError(f'Could not parse {self.sport} {self.mode} lineup: "{lineup_str}"')
+
+        return parts
+
+    def tokenize(self, lineups) -> np.ndarray:
+        """
+        Sequence of lineup strings -> (n_lineups, n_slots) object array of names
+        """
+        lineups = list(lineups)
+        rows = self.pattern.findall('\n'.join(lineups))
+
+        # Something did not match the fast path, go row by row so every lineup lines up with its row
+        if len(rows) != len(lineups):
+            rows = [self.tokenize_one(lineup_str) for lineup_str in lineups]
+
+        return np.array(rows, dtype=object).reshape(len(lineups), self.width)
@@ -1,3 +1,5 @@
 from .process_draftkings_file import ProcessDraftKingsFile
+from .corpus_store import CorpusStore
+from .tournament_combos import tournament_combos
 
 version='1.0.0'
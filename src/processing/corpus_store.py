@@ -0,0 +1,313 @@
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from .process_draftkings_file import ProcessDraftKingsFile
+
+
+class CorpusStore:
+    """
+    Compiled store of one directory of max-entry lineup files (data/max-entries/<tournament>)
+        <path>/manifest.json   player dictionary + one entry per CSV: mtime, size, rows, header, layout
+                               (CSVs that could not be parsed are listed under unusable with the error instead)
+        <path>/lineups.<generation>.npy
+                               int32 matrix of player codes for every file's lineups, one after the other
+                               (-1 for an empty slot), memory-mapped when loaded
+    Every build writes a new generation of lineups and then swaps manifest.json, which names it, into place:
+    that one rename publishes the whole store, so readers and concurrent builders never mix two builds
+    path is <directory>/.store unless given, e.g. somewhere writable when the data directory is not
+    If path can not be written either, the store is kept in memory only and rebuilt by every new process
+    Directory listings and file loads are served from the store, only CSVs whose mtime / size changed get re-parsed
+    The player dictionary only ever grows, so codes of files that did not change stay valid
+    """
+
+    STORE_DIR = '.store'
+
+    # Seconds between two scans of the directory for added, removed or modified CSVs
+    CHECK_INTERVAL = 2.0
+
+    # Unpublished generations (crashed or outraced builds) older than this are deleted by the next build
+    STALE_SECONDS = 3600
+
+    # Loaded stores of this process, {(directory, path): CorpusStore}
+    __stores = {}
+    __stores_lock = threading.Lock()
+
+    def __init__(self, directory: str, path: str | None = None):
+
+        self.directory = directory
+        self.path = path or os.path.join(directory, self.STORE_DIR)
+        self.in_memory = False
+
+        self.players = []
+        self.ids = {}
+        self.files = {}
+        self.unusable = {}
+        self.codes = np.empty((0, 0), dtype=np.int32)
+
+        self.checked = 0.0
+        self.__lock = threading.Lock()
+
+        self.read()
+
+    @classmethod
+    def load(cls, directory: str, path: str | None = None) -> 'CorpusStore':
+        """
+        Store of directory, opened once per process and brought up to date (at most every CHECK_INTERVAL seconds)
+        Callers must check directory, every one asked for is scanned, compiled and kept for the life of the process
+        """
+        directory = os.path.abspath(directory)
+        path = os.path.abspath(path) if path else None
+
+        with cls.__stores_lock:
+            if (directory, path) not in cls.__stores:
+                cls.__stores[(directory, path)] = cls(directory, path)
+            store = cls.__stores[(directory, path)]
+
+        store.refresh()
+        return store
+
+    def read(self) -> bool:
+        """
+        Loads the compiled store from disk, False if there is none (yet)
+        """
+        manifest_path = os.path.join(self.path, 'manifest.json')
+        if not os.path.exists(manifest_path):
+            return False
+
+        for attempt in range(3):
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+
+            # Stores from before generations were introduced have a plain lineups.npy
+            try:
+                codes = np.load(os.path.join(self.path, manifest.get('lineups', 'lineups.npy')), mmap_mode='r')
+                break
+            except FileNotFoundError:
+                # Superseded (and deleted) by another build in between, its manifest is already in place
+                if attempt == 2:
+                    raise
+
+        self.players = manifest['players']
+        self.ids = {name: code for code, name in enumerate(self.players)}
+        self.files = manifest['files']
+        self.unusable = manifest.get('unusable', {})
+        self.codes = codes
+
+        return True
+
+    def scan(self) -> dict[str,list[int]]:
+        """
+        {file name (no .csv): [mtime_ns, size]} of every CSV in the directory
+        """
+        return {
+            entry.name[:-len('.csv')]: [entry.stat().st_mtime_ns, entry.stat().st_size]
+            for entry in os.scandir(self.directory)
+            if entry.is_file() and entry.name.endswith('.csv')
+        }
+
+    def refresh(self, force: bool = False) -> None:
+        """
+        Recompiles the store if any CSV was added, removed or modified since it was built
+        """
+        if not force and time.monotonic() - self.checked < self.CHECK_INTERVAL:
+            return
+
+        with self.__lock:
+            self.checked = time.monotonic()
+
+            scanned = self.scan()
+            current = {name: [file_['mtime_ns'], file_['size']] for name, file_ in {**self.files, **self.unusable}.items()}
+
+            if force or scanned != current or not (self.in_memory or os.path.exists(os.path.join(self.path, 'manifest.json'))):
+                self.build(scanned)
+
+    @staticmethod
+    def parse_file(path: str) -> tuple[list[str], bool, pd.DataFrame]:
+        """
+        One CSV -> (roster slot header, is it a DraftKings file, lineups of names)
+        Same tokenizing as uploads (see ProcessDraftKingsFile.tokenize), so "(ID)" suffixes are split off as well
+        """
+        content = ProcessDraftKingsFile.read_bytes(path)
+        header = next(csv.reader(io.StringIO(content.decode('utf-8-sig'))), [])
+
+        is_dk = ProcessDraftKingsFile.is_dk_header(content[:4096])
+        if is_dk:
+            # Roster slots run from the first 4 columns up to the blank column before the instructions
+            slots = header[ProcessDraftKingsFile.DK_OFFSET:]
+            header = slots[:slots.index('')] if '' in slots else slots
+            lineups, _ = ProcessDraftKingsFile.tokenize(content, header, ProcessDraftKingsFile.DK_OFFSET, complete_only=True)
+        else:
+            lineups, _ = ProcessDraftKingsFile.tokenize(content, header, 0, complete_only=False)
+
+        return header, is_dk, lineups
+
+    def encode(self, lineups: pd.DataFrame) -> np.ndarray:
+        """
+        Lineups of names -> int32 player codes (-1 for an empty slot), new names are added to the dictionary
+        """
+        codes, uniques = pd.factorize(lineups.to_numpy(dtype=object).ravel(), use_na_sentinel=True)
+
+        mapping = np.array([self.ids.setdefault(name, len(self.ids)) for name in uniques], dtype=np.int32)
+        self.players = list(self.ids)
+
+        encoded = np.full(codes.shape, -1, dtype=np.int32)
+        encoded[codes >= 0] = mapping[codes[codes >= 0]]
+
+        return encoded.reshape(lineups.shape)
+
+    def build(self, scanned: dict[str,list[int]]) -> None:
+        """
+        Writes the store for the scanned CSVs, reusing the rows of every file that did not change
+        A CSV that fails to parse (e.g. not UTF-8) is recorded as unusable and left out, until it changes again
+        """
+        blocks, files, unusable = [], {}, {}
+        start = 0
+
+        for name in sorted(scanned):
+            mtime_ns, size = scanned[name]
+            previous = self.files.get(name)
+
+            if name in self.unusable and [self.unusable[name]['mtime_ns'], self.unusable[name]['size']] == [mtime_ns, size]:
+                unusable[name] = self.unusable[name]
+                continue
+
+            if previous is not None and [previous['mtime_ns'], previous['size']] == [mtime_ns, size]:
+                block = np.asarray(self.codes[previous['start']:previous['stop'], :previous['width']])
+                header, is_dk = previous['header'], previous['is_dk']
+            else:
+                print(f'Compiling {os.path.join(self.directory, name)}.csv')
+                try:
+                    header, is_dk, lineups = self.parse_file(os.path.join(self.directory, f'{name}.csv'))
+                    block = self.encode(lineups)
+                except Exception as e:
+                    print(f'Skipping {os.path.join(self.directory, name)}.csv: {e}')
+                    unusable[name] = {'mtime_ns': mtime_ns, 'size': size, 'error': str(e)}
+                    continue
+
+            blocks.append(block)
+            files[name] = {
+                'mtime_ns': mtime_ns,
+                'size': size,
+                'start': start,
+                'stop': start + len(block),
+                'width': block.shape[1],
+                'header': header,
+                'is_dk': is_dk
+            }
+            start += len(block)
+
+        # Files can be different widths (sports), narrower ones are padded with empty slots
+        width = max((block.shape[1] for block in blocks), default=0)
+        codes = np.full((start, width), -1, dtype=np.int32)
+        for name, block in zip(files, blocks):
+            codes[files[name]['start']:files[name]['stop'], :block.shape[1]] = block
+
+        try:
+            self.publish(codes, {'players': self.players, 'files': files, 'unusable': unusable})
+
+        except OSError as e:
+            # Read-only location, the compiled store only lives in this process
+            print(f'Could not write store {self.path}, keeping it in memory: {e}')
+            self.in_memory = True
+            self.files = files
+            self.unusable = unusable
+            self.codes = codes
+            return
+
+        self.in_memory = False
+        self.read()
+
+    def publish(self, codes: np.ndarray, manifest: dict) -> None:
+        """
+        Writes codes as a new generation, then swaps in the manifest naming it
+            - Every name written is unique to this build, concurrent builders never share a file
+            - The generation the swap replaced is deleted, readers still on it reload the manifest (see read())
+        """
+        os.makedirs(self.path, exist_ok=True)
+
+        generation = f'lineups.{uuid.uuid4().hex}.npy'
+        np.save(os.path.join(self.path, generation), codes)
+
+        fd, manifest_tmp = tempfile.mkstemp(dir=self.path, prefix='manifest.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({**manifest, 'lineups': generation}, f)
+
+            manifest_path = os.path.join(self.path, 'manifest.json')
+            replaced = None
+            if os.path.exists(manifest_path):
+                with open(manifest_path, 'r') as f:
+                    replaced = json.load(f).get('lineups', 'lineups.npy')
+
+            os.replace(manifest_tmp, manifest_path)
+        except BaseException:
+            for path in [manifest_tmp, os.path.join(self.path, generation)]:
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+
+        # Superseded generation, plus leftovers of builds that never got to publish
+        for entry in os.scandir(self.path):
+            if not entry.name.startswith(('lineups.', 'manifest.')) or entry.name in [generation, 'manifest.json']:
+                continue
+
+            if entry.name == replaced or time.time() - entry.stat().st_mtime > self.STALE_SECONDS:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    # Still memory-mapped on platforms that do not allow removing it, the next build tries again
+                    pass
+
+    def listing(self) -> list[str]:
+        """
+        File names (no .csv), ordered by their first letter
+        """
+        return sorted(sorted(self.files), key=lambda file_: file_[0].lower())
+
+    def file_codes(self, name: str) -> np.ndarray:
+        """
+        (lineups, slots) int32 player codes of one file, -1 for an empty slot
+        Raises KeyError for a file that is not in the directory
+        """
+        file_ = self.files[name]
+        return self.codes[file_['start']:file_['stop'], :file_['width']]
+
+    def lineups(self, name: str, columns: list[str,...]) -> pd.DataFrame:
+        """
+        Lineups of one file as names, the first len(columns) slots with columns as the header (NaN for an empty slot)
+        """
+        codes = self.file_codes(name)
+        if codes.shape[1] < len(columns):
+            raise ValueError(f'{name} has {codes.shape[1]} roster slots, {len(columns)} were asked for')
+
+        players = np.array(self.players + [np.nan], dtype=object)
+        return pd.DataFrame(players[codes[:, :len(columns)]], columns=columns)
+
+
+def main(root: str, store_root: str | None = None) -> None:
+    """
+    Build step: compiles every tournament directory under root (and root itself)
+    Stores go to each directory's .store, or to the same layout under store_root (e.g. the app's cache directory)
+    """
+    directories = [root] + [entry.path for entry in os.scandir(root) if entry.is_dir() and entry.name != CorpusStore.STORE_DIR]
+
+    for directory in directories:
+        path = os.path.join(store_root, os.path.relpath(directory, root)) if store_root else None
+        store = CorpusStore(directory, os.path.normpath(path) if path else None)
+        store.refresh(force=True)
+        print(f'{directory}: {len(store.files)} files, {len(store.codes)} lineups, {len(store.players)} players')
+
+
+if __name__ == '__main__':
+    # Run from src/: python -m processing.corpus_store [data/max-entries] [store root]
+    main(sys.argv[1] if len(sys.argv) > 1 else os.path.join('data', 'max-entries'), sys.argv[2] if len(sys.argv) > 2 else None)
@@ -1,16 +1,89 @@
+import csv
+import io
+from collections import Counter
+
+import numpy as np
 import pandas as pd
 
 from __info import PLAYER_COLUMNS
 
 class ProcessDraftKingsFile:
 
+    # DraftKings files first 4 columns are: Entry ID   Contest Name   Contest ID   Entry Fee
+    DK_OFFSET = 4
+
+    @staticmethod
+    def read_bytes(path) -> bytes:
+        """
+        Content of a path, an open file / filestream or bytes that were already read
+        """
+        if isinstance(path, bytes):
+            return path
+
+        if hasattr(path, 'read'):
+            return path.read()
+
+        with open(path, 'rb') as f:
+            return f.read()
+
+    @staticmethod
+    def is_dk_header(head: bytes) -> bool:
+        """
+        Sniffs the layout from the first bytes of a file, DraftKings files have an Entry ID column
+        """
+        first_line = head.split(b'\n', 1)[0].decode('utf-8-sig', errors='ignore')
+        return any('Entry ID' in column for column in next(csv.reader([first_line]), []))
+
+    @staticmethod
+    def split_id(cell: str) -> tuple[str, int]:
+        """
+        DraftKings cell -> (name, DK player ID)
+        EXAMPLE: "Nikola Jokic (36512043)" -> ("Nikola Jokic", 36512043), a cell without an ID gets -1
+        """
+        name, parenthesis, player_id = cell.rpartition('(')
+        if parenthesis and player_id.endswith(')') and player_id[:-1].strip().isdigit():
+            return name.strip(), int(player_id[:-1])
+
+        return cell.strip(), -1
+
+    @staticmethod
+    def tokenize(content: bytes, columns: list[str,...], offset: int, complete_only: bool) -> tuple[pd.DataFrame, np.ndarray]:
+        """
+        Single pass over the CSV rows, each lineup cell is split into name and player ID as it is read
+            - offset: column of the first roster slot (DK_OFFSET for DraftKings files, 0 for custom ones)
+            - complete_only: rows with an empty slot are skipped (DK files have the player table below the lineups),
+              otherwise missing slots are NaN
+        Returns (lineups of names with columns as header, int64 array of player IDs)
+        """
+        reader = csv.reader(io.StringIO(content.decode('utf-8-sig')))
+        next(reader, None)
+
+        width = len(columns)
+        names, ids = [], []
+        for row in reader:
+            cells = row[offset:offset+width]
+            cells += [''] * (width - len(cells))
+            filled = [len(cell.strip()) > 0 for cell in cells]
+
+            if not any(filled) or (complete_only and not all(filled)):
+                continue
+
+            split = [ProcessDraftKingsFile.split_id(cell) if filled_ else (np.nan, -1) for cell, filled_ in zip(cells, filled)]
+            names.append([name for name, _ in split])
+            ids.append([player_id for _, player_id in split])
+
+        return (
+            pd.DataFrame(names, columns=columns),
+            np.array(ids, dtype=np.int64).reshape(len(ids), width)
+        )
+
     @staticmethod
     def extract_player_data_from_dk_file(path) -> pd.DataFrame:
         """
         Extracts the player data that is provided with upload templates
             Position   Name + ID   Name   ID   Roster Position   Salary   Game Info
         """
-        df = pd.read_csv(path, skiprows=7)
+        df = pd.read_csv(io.BytesIO(ProcessDraftKingsFile.read_bytes(path)), skiprows=7)
         columns = list(df.columns)[11:16]
 
         # Keeping position in just in case data is useful later
@@ -25,50 +98,104 @@ class ProcessDraftKingsFile:
                )
 
     @staticmethod
-    def extract_lineups_from_dk_file(path: str, columns: list[str,...]) -> pd.DataFrame:
+    def base_ids(players: pd.DataFrame, lineups: pd.DataFrame, player_ids: np.ndarray) -> np.ndarray:
         """
-        Extracts the lineups from DraftKings file
-        Offsets by 4 since DK files first 4 are:
-            Entry ID   Contest Name   Contest ID   Entry Fee
+        Showdown: DK gives a player's CPT entry an ID of its own, it is folded into the player's base (non-CPT) ID
+        so one player is counted as one whichever slot they fill
+            - Base IDs come from the player table (CPT rows are dropped there), or from the non-CPT slots without one
+            - Matched by name, a name with more than one base ID (different players) keeps its CPT ID
         """
+        captain = np.asarray(lineups.columns == 'CPT')
+        if not captain.any():
+            return player_ids
 
+        names = lineups.to_numpy(dtype=object)
+        if len(players):
+            pairs = zip(players['name'].tolist(), players['id'].tolist())
+        else:
+            pairs = zip(names[:, ~captain].ravel().tolist(), player_ids[:, ~captain].ravel().tolist())
 
+        ids_by_name = {}
+        for name, id_ in pairs:
+            if id_ >= 0:
+                ids_by_name.setdefault(name, set()).add(id_)
+        base = {name: next(iter(ids)) for name, ids in ids_by_name.items() if len(ids) == 1}
 
-        #Issue is here
-        ret = (pd
-                .read_csv(path, usecols=range(4, 4+len(columns)))
-                .set_axis(columns, axis=1)
-                .dropna()
-                # # Replace IDs
-                .replace(r'\s*\(\d+\)', '', regex=True)
-               )
+        folded = player_ids.copy()
+        for column in np.flatnonzero(captain):
+            folded[:, column] = [
+                base.get(name, id_) if id_ >= 0 else id_
+                for name, id_ in zip(names[:, column].tolist(), player_ids[:, column].tolist())
+            ]
+
+        return folded
+
+    @staticmethod
+    def player_labels(players: pd.DataFrame, lineups: pd.DataFrame, player_ids: np.ndarray) -> dict[int,str]:
+        """
+        DK player ID -> name, joined once from the player table (names in the lineups fill in IDs it does not have)
+        Different players with the same name are told apart as "Name (ID)"
+        """
+        names = dict(zip(player_ids.ravel().tolist(), lineups.to_numpy().ravel().tolist()))
+        names.pop(-1, None)
+        names.update(zip(players['id'].tolist(), players['name'].tolist()))
 
-        return ret
+        name_counts = Counter(names.values())
+        return {id_: name if name_counts[name] == 1 else f'{name} ({id_})' for id_, name in names.items()}
+
+    @staticmethod
+    def extract_lineups_from_dk_file(path: str, columns: list[str,...]) -> pd.DataFrame:
+        """
+        Extracts the lineups from DraftKings file
+        Offsets by 4 since DK files first 4 are:
+            Entry ID   Contest Name   Contest ID   Entry Fee
+        The (ID) after each name is split off while tokenizing, see tokenize()
+        """
+        return ProcessDraftKingsFile.tokenize(ProcessDraftKingsFile.read_bytes(path), columns, ProcessDraftKingsFile.DK_OFFSET, True)[0]
 
     def __init__(
             self,
-            path: str,
+            path,
             sport: str,
             mode: str,
             is_dk_file: bool
         ):
 
-        # Path is actually type <tempfile.SpooledTemporaryFile> not a str or <os.path>
-        # Because it is a filestream, it can only be used in a pd.read_csv() once before becoming unavailble.
-        # Therefore, a bool was created that the user has to check on the webpage
+        # Path can be a str, bytes already read, or a <tempfile.SpooledTemporaryFile> filestream
+        # A filestream can only be read once, so everything comes from a single read of its bytes
+        # The bool is what the user checked on the webpage, see is_dk_header() for sniffing it from the file
 
         self.path = path
 
         self.columns = PLAYER_COLUMNS[sport][mode]
         self.is_dk_file = is_dk_file
 
+        content = self.read_bytes(self.path)
+
+        # lineups: names per roster slot, player_ids: matching DK IDs (-1 where the file has none, e.g. custom files)
+        self.lineups, self.player_ids = self.tokenize(
+            content,
+            self.columns,
+            self.DK_OFFSET if self.is_dk_file else 0,
+            complete_only=self.is_dk_file
+        )
+
+        # keys: what gets counted, DK player IDs when the file has them (names only where a cell has no ID, e.g. LOCKED)
+        # labels: DK player ID -> name, only used when results are shown
+        self.players = pd.DataFrame(columns=['pos', 'name', 'id'])
+        self.keys = self.lineups
+        self.labels = {}
+
         if self.is_dk_file:
-            self.lineups = self.extract_lineups_from_dk_file(self.path, self.columns)
-        
-        else:
-            self.lineups = (pd
-                           .read_csv(self.path, usecols=range(len(self.columns)))
-                           .set_axis(self.columns, axis=1)
-                           )
+            # Upload templates have the player table next to the lineups, entries files may not
+            try:
+                self.players = self.extract_player_data_from_dk_file(content)
+            except (KeyError, ValueError, IndexError, pd.errors.ParserError) as e:
+                print(f'No DraftKings player table found: {e}')
 
-        
+            self.player_ids = self.base_ids(self.players, self.lineups, self.player_ids)
+            self.labels = self.player_labels(self.players, self.lineups, self.player_ids)
+            self.keys = pd.DataFrame(
+                np.where(self.player_ids >= 0, self.player_ids.astype(object), self.lineups.to_numpy(dtype=object)),
+                columns=self.columns
+            )
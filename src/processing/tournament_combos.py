@@ -0,0 +1,92 @@
+import heapq
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from combocounter.combocounter import ComboCounterDict
+from combocounter.sharding import count_shard, merge_counts
+from .corpus_store import CorpusStore
+
+
+def tournament_combos(
+        store: CorpusStore,
+        columns: list[str,...],
+        *,
+        files: list[str,...] | None = None,
+        level: int = 2,
+        top_n: int = 25,
+        exclude: tuple[str,...] = (),
+        engine: str = 'numpy',
+        workers: int = 1,
+        shard_threshold: int = 200_000
+    ) -> tuple[dict[str,dict], pd.DataFrame, pd.DataFrame]:
+    """
+    Combo counting for every contestant file of a tournament (CorpusStore) in one call
+        - Files come already parsed from the store and share its player dictionary, so counting runs on player codes
+          and names are only looked up for the returned combos
+        - Each file is counted at level on its own, in-process unless workers > 1 and the pool has at least
+          shard_threshold lineups (a whole tournament usually counts faster than a process pool starts up)
+        - Pool-wide counts are the per-file counts added up
+        - Combos with an excluded name (e.g. LOCKED) or an empty slot are left out
+        - files limits the run to some of the store's files (default: all of them)
+    Returns:
+        contestants: {contestant: {combo: count}}, each contestant's top_n combos
+        pool: index = combo, columns = count, pct (% of all the pool's lineups), the pool's top_n combos
+        shares: index = combo (same as pool), columns = contestant, values = % of the combo's pool count from the contestant
+    """
+    names = store.listing() if files is None else [name for name in store.listing() if name in files]
+    players = store.players
+
+    # Empty slots get a code of their own so every row keeps its width, their combos are dropped below
+    empty = len(players)
+    if empty >= ComboCounterDict.MAX_PLAYERS:
+        raise ValueError(f'At most {ComboCounterDict.MAX_PLAYERS-1} distinct players can be counted, the store has {empty}')
+
+    rows = []
+    for name in names:
+        codes = np.asarray(store.file_codes(name)[:, :len(columns)])
+        rows.append([tuple(row) for row in np.where(codes < 0, empty, codes).tolist()])
+
+    n_lineups = sum(len(rows_) for rows_ in rows)
+
+    if workers > 1 and len(names) > 1 and n_lineups >= shard_threshold:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            counts = [result[level] for result in pool.map(count_shard, [engine]*len(names), rows, [[level]]*len(names))]
+    else:
+        counts = [count_shard(engine, rows_, [level])[level] for rows_ in rows]
+
+    excluded = {empty} | {code for code, player in enumerate(players) if player in exclude}
+
+    def keep(key: bytes) -> bool:
+        return excluded.isdisjoint(ComboCounterDict.unpack(key))
+
+    def decode(key: bytes):
+        combo = [players[code] for code in ComboCounterDict.unpack(key)]
+        return combo[0] if len(combo) == 1 else tuple(sorted(combo))
+
+    contestants = {
+        name: {decode(key): count for key, count in heapq.nlargest(top_n, filter(lambda item: keep(item[0]), counts_.items()), key=lambda item: item[1])}
+        for name, counts_ in zip(names, counts)
+    }
+
+    # Pool-wide counts, copies so the per-file dicts stay as they are
+    pool_counts = {level: dict()}
+    for counts_ in counts:
+        merge_counts(pool_counts, {level: dict(counts_)})
+
+    top = heapq.nlargest(top_n, filter(lambda item: keep(item[0]), pool_counts[level].items()), key=lambda item: item[1])
+    combos = pd.Index([decode(key) for key, _ in top], tupleize_cols=False)
+
+    pool = (pd
+            .DataFrame({'count': [count for _, count in top]}, index=combos)
+            .assign(pct=lambda df_: 100 * df_['count'] / n_lineups)
+           )
+
+    shares = pd.DataFrame(
+        np.column_stack([[100 * counts_.get(key, 0) / count for key, count in top] for counts_ in counts]) if len(names) else np.empty((len(top), 0)),
+        index=combos,
+        columns=pd.Index(names, name='contestant')
+    )
+
+    return contestants, pool, shares